@@ -3,6 +3,7 @@
 CareMind · MVP CDSS · 前端 (Streamlit)
 依赖：
   - streamlit>=1.32
+  - orjson
 项目约定：
   - 后端推理入口：rag.pipeline.answer(question: str, drug_name: Optional[str], k: int) -> dict
 返回字典示例：
@@ -18,11 +19,68 @@ CareMind · MVP CDSS · 前端 (Streamlit)
 
 from __future__ import annotations
 
-import json
-from typing import Any, Dict, List, Optional
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 
+import numpy as np
+import orjson
 import streamlit as st
-from pipeline import answer  # 你已实现的后端入口
+
+
+# ---------------------------
+# 后端懒加载：pipeline 会加载向量库/嵌入模型/LLM 客户端，仅在首次提交时导入，
+# st.cache_resource 保证整个进程只初始化一次；纯控件交互的 rerun 不触发
+# ---------------------------
+@st.cache_resource(show_spinner="加载推理后端…")
+def _get_answer_fn():
+    from pipeline import answer  # 你已实现的后端入口
+    return answer
+
+
+@st.cache_resource(show_spinner=False)
+def _get_embed_fn():
+    from pipeline import embed_question
+    return embed_question
+
+
+# ---------------------------
+# 后端调用缓存：相同 (问题, 药品, Top-K) 直接复用结果（跨会话共享，24 小时过期）
+# _q_emb 为本页已算好的问题向量，直接交给 answer() 复用（下划线参数不参与缓存键），
+# 避免同一问题被 bge 编码两次
+# ---------------------------
+@st.cache_data(ttl=24 * 3600, max_entries=512, show_spinner=False)
+def _cached_answer(q: str, drug: Optional[str], k: int,
+                   _q_emb: Optional[List[float]] = None) -> Dict[str, Any]:
+    return _get_answer_fn()(q, drug_name=drug, k=k, query_embedding=_q_emb)
+
+
+# ---------------------------
+# 语义缓存（本会话）：改写/近义的问题（余弦相似度 ≥ 阈值，且药品与 Top-K 相同）直接复用结果
+# 条目：(向量, 问题, 药品, Top-K, 结果)，按最近使用排序，超出容量淘汰最久未用
+# ---------------------------
+SEM_CACHE_THRESHOLD = 0.92
+SEM_CACHE_SIZE = 256
+
+
+def _semantic_lookup(vec: np.ndarray, drug: Optional[str], k: int) -> Optional[Tuple[str, Dict[str, Any]]]:
+    cache: List[Tuple[np.ndarray, str, Optional[str], int, Dict[str, Any]]] = st.session_state.get("sem_cache") or []
+    idx = [i for i, e in enumerate(cache) if e[2] == drug and e[3] == k]
+    if not idx:
+        return None
+    sims = np.stack([cache[i][0] for i in idx]) @ vec
+    best = int(np.argmax(sims))
+    if sims[best] < SEM_CACHE_THRESHOLD:
+        return None
+    entry = cache.pop(idx[best])
+    cache.append(entry)  # 移到队尾 = 最近使用
+    return entry[1], entry[4]
+
+
+def _semantic_store(vec: np.ndarray, q: str, drug: Optional[str], k: int, res: Dict[str, Any]) -> None:
+    cache = st.session_state.setdefault("sem_cache", [])
+    cache.append((vec, q, drug, k, res))
+    if len(cache) > SEM_CACHE_SIZE:
+        cache.pop(0)
 
 # ---------------------------
 # 基础页面配置 & 轻量样式
@@ -33,49 +91,18 @@ st.set_page_config(
     page_icon="💊",
 )
 
-# 轻量 CSS：更紧凑的卡片风格 & 引用徽章
-st.markdown(
-    """
-    <style>
-    .cm-badge {
-        display:inline-block;
-        padding:2px 8px;
-        border-radius:12px;
-        font-size:12px;
-        background:#eef2ff;
-        border:1px solid #c7d2fe;
-        margin-right:6px;
-        white-space:nowrap;
-    }
-    .cm-chip {
-        display:inline-block;
-        padding:2px 8px;
-        border-radius:8px;
-        font-size:12px;
-        background:#f1f5f9;
-        border:1px solid #e2e8f0;
-        margin:0 6px 6px 0;
-    }
-    .cm-card {
-        border:1px solid #e5e7eb;
-        background:#ffffff;
-        border-radius:12px;
-        padding:12px 14px;
-        margin-bottom:10px;
-    }
-    .cm-muted {
-        color:#64748b;
-        font-size:13px;
-    }
-    .cm-output {
-        line-height:1.6;
-        font-size:16px;
-    }
-    footer {visibility: hidden;}
-    </style>
-    """,
-    unsafe_allow_html=True,
-)
+# 轻量 CSS：更紧凑的卡片风格 & 引用徽章（static/caremind.css）
+# 每个进程只读一次文件；每次 rerun 仍需输出该元素（未重新输出的元素会被 Streamlit 移除），
+# 内容不变时前端不会重新渲染。
+CSS_PATH = Path(__file__).parent / "static" / "caremind.css"
+
+
+@st.cache_resource(show_spinner=False)
+def _load_css() -> str:
+    return f"<style>\n{CSS_PATH.read_text(encoding='utf-8')}</style>"
+
+
+st.markdown(_load_css(), unsafe_allow_html=True)
 
 # ---------------------------
 # Sidebar：检索与显示设置
@@ -85,6 +112,10 @@ with st.sidebar:
     k = st.slider("检索片段数（Top-K）", min_value=2, max_value=8, value=4, step=1)
     show_meta = st.toggle("显示片段元数据行", value=True)
     expand_hits = st.toggle("展开所有片段", value=False)
+    if st.button("清空缓存", use_container_width=True):
+        _cached_answer.clear()
+        st.session_state.pop("sem_cache", None)
+        st.toast("已清空结果缓存")
     st.divider()
     st.markdown(
         "#### 🧪 使用建议\n"
@@ -129,7 +160,21 @@ with col_left:
         else:
             with st.spinner("检索与生成中…"):
                 try:
-                    res = answer(q.strip(), drug_name=(drug.strip() or None), k=int(k))
+                    q_key, drug_key = q.strip(), (drug.strip() or None)
+                    try:
+                        vec = np.asarray(_get_embed_fn()(q_key), dtype=np.float32)
+                    except Exception:
+                        vec = None  # 向量化失败时跳过语义缓存，不影响正常推理
+                    hit = _semantic_lookup(vec, drug_key, int(k)) if vec is not None else None
+                    if hit:
+                        similar_q, res = hit
+                        if similar_q != q_key:
+                            st.caption(f"♻️ 复用相似问题的结果：{similar_q}")
+                    else:
+                        res = _cached_answer(q_key, drug_key, int(k),
+                                             _q_emb=vec.tolist() if vec is not None else None)
+                        if vec is not None:
+                            _semantic_store(vec, q_key, drug_key, int(k), res)
                 except Exception as e:
                     st.error("后端推理出现异常，请查看后端日志或稍后重试。")
                     st.exception(e)
@@ -157,10 +202,15 @@ with col_left:
         with col_btn1:
             st.code(output_text, language="markdown")
         with col_btn2:
-            download_payload = json.dumps(res, ensure_ascii=False, indent=2)
+            # orjson 直接产出 UTF-8 字节（中文不转义），无需再 encode；
+            # OPT_SERIALIZE_NUMPY：检索分数可能是 numpy 类型（与 server.py / pipeline 输出一致）
+            download_payload = orjson.dumps(
+                res,
+                option=orjson.OPT_INDENT_2 | orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY,
+            )
             st.download_button(
                 "下载本次结果（JSON）",
-                data=download_payload.encode("utf-8"),
+                data=download_payload,
                 file_name="caremind_response.json",
                 mime="application/json",
                 use_container_width=True,
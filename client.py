@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+"""
+CareMind RAG — Thin CLI Client for server.py
+
+Sends a question to an already running server (see server.py) and prints the
+answer. On purpose this module imports only httpx + orjson: no retriever, no
+vector DB, no embedding model and no Ollama warm-up, so a query costs one HTTP
+round trip instead of the full `python -m rag.pipeline` start-up.
+
+--------------------------------------------------------------------------------
+Quick Start (from project root, with `uvicorn rag.server:app` running):
+    python -m rag.client --q "老年高血压的降压目标？" --drug "氨氯地平"
+    python -m rag.client --server http://10.0.0.5:8000 --q "..." --json
+
+Env Vars:
+    CAREMIND_SERVER   default server URL (default http://localhost:8000)
+--------------------------------------------------------------------------------
+"""
+
+from __future__ import annotations
+import os
+import argparse
+from typing import Any, Dict, Optional
+
+import httpx
+import orjson
+
+SERVER = os.getenv("CAREMIND_SERVER", "http://localhost:8000").rstrip("/")
+
+
+def answer_via_server(question: str, drug: Optional[str] = None, k: int = 4,
+                      use_cache: bool = True, server: str = SERVER,
+                      timeout: float = 300.0) -> Dict[str, Any]:
+    """POST the question to a running server.py; returns the same dict as pipeline.answer()."""
+    r = httpx.post(
+        f"{server.rstrip('/')}/answer",
+        content=orjson.dumps({"question": question, "drug": drug, "k": k, "use_cache": use_cache}),
+        headers={"Content-Type": "application/json; charset=utf-8"},
+        timeout=httpx.Timeout(timeout, connect=10.0),
+    )
+    r.raise_for_status()
+    return orjson.loads(r.content)
+
+
+def _build_cli() -> argparse.ArgumentParser:
+    p = argparse.ArgumentParser(
+        prog="CareMind-RAG-Client",
+        description="Ask a running CareMind server (server.py) over HTTP."
+    )
+    p.add_argument("--server", default=SERVER,
+                   help="CareMind 服务地址（默认取 CAREMIND_SERVER，否则 http://localhost:8000）")
+    p.add_argument("--q", "--question", dest="question", required=True,
+                   help="临床问题（中文推荐）")
+    p.add_argument("--drug", dest="drug", default=None,
+                   help="药品名称（可选）")
+    p.add_argument("--k", dest="k", type=int, default=4,
+                   help="检索到的指南片段数量（Top-k）")
+    p.add_argument("--print-prompt", action="store_true",
+                   help="调试：打印拼接后的 user prompt")
+    p.add_argument("--json", action="store_true",
+                   help="以 JSON 格式输出完整结果")
+    p.add_argument("--no-cache", action="store_true",
+                   help="不使用语义缓存（每次都检索并调用 LLM）")
+    return p
+
+
+def main() -> None:
+    """Entry point for `python -m rag.client`; output mirrors `python -m rag.pipeline`."""
+    args = _build_cli().parse_args()
+    res = answer_via_server(args.question, drug=args.drug, k=args.k,
+                            use_cache=not args.no_cache, server=args.server)
+
+    if args.json:
+        print(orjson.dumps(res, option=orjson.OPT_INDENT_2).decode("utf-8"))
+        return
+
+    if args.print_prompt:
+        print("====== SYSTEM ======")
+        print(res["prompt"]["system"])
+        print("\n====== USER ======")
+        print(res["prompt"]["user"])
+        print("\n====== OUTPUT ======")
+
+    print(res["output"])
+
+
+if __name__ == "__main__":
+    main()
@@ -22,16 +22,22 @@ drugs_builder.py
 python drugs_builder.py \
   --in ~/caremind/data/drug_list.txt \
   --out ~/caremind/data/drugs.xlsx \
-  --nmpa-offline-dir ~/caremind/data/nmpa_labels
+  --nmpa-offline-dir ~/caremind/data/nmpa_labels \
+  --cache-db ~/caremind/data/http_cache.sqlite \
+  --checkpoint-every 200
 
 环境
 ----
 - Python 3.10+
-- 依赖: requests, beautifulsoup4, lxml, pandas, openpyxl, tenacity, pdfminer.six, PyPDF2, chardet, python-dotenv
+- 依赖: httpx[http2], lxml, pandas, xlsxwriter, tenacity, pypdfium2, pdfminer.six, PyPDF2, chardet, python-dotenv
+- 可选: pyarrow（--parquet 额外输出 Parquet；--checkpoint-every 检查点）
 
 注意
 ----
 - 尊重 NMPA / DrugBank 使用条款与 robots.txt，控制请求频率。
+- --checkpoint-every N：每处理 N 个药品在后台写一次检查点（<out>.checkpoint.parquet，需 pyarrow）；
+  中断后加 --resume 重跑，已完成的药品直接从检查点恢复。
+- --cache-db 启用本地 SQLite 响应缓存：重复构建时已抓取过的页面/接口不再联网，仅按 --cache-ttl-days 过期。
 - DrugBank：需要授权 API key（.env）。
 - 医学用途免责声明：本工具仅作信息整合，非医疗建议。
 """
@@ -42,14 +48,23 @@ import re
 import time
 import json
 import argparse
+import bisect
+import hashlib
+import sqlite3
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Optional, Dict, List, Tuple
+from typing import Optional, Dict, List, Set, Tuple
 
-import requests
-from bs4 import BeautifulSoup
+import httpx
+from lxml import html as lxml_html
 import pandas as pd
+import xlsxwriter
+from io import StringIO
 from tenacity import retry, stop_after_attempt, wait_exponential, retry_if_exception_type
-from pdfminer.high_level import extract_text as pdf_extract_text
+import pypdfium2 as pdfium
+from pdfminer.high_level import extract_text_to_fp
 from PyPDF2 import PdfReader
 import chardet
 from dotenv import load_dotenv
@@ -68,8 +83,31 @@ SECTION_PATTERNS = [
     # 妊娠/哺乳期用药可能以多种形式出现
     ("妊娠分级", r"(?:【孕妇及哺乳期用药】|孕妇及哺乳期用药|孕期用药|妊娠用药)[：:\s]*"),
 ]
+# 模块加载时把各节标题融合为一个预编译的交替正则，一次扫描即可定位全部字段
+SECTION_SCAN_RE = re.compile(
+    "|".join(f"(?P<k{i}>{pat})" for i, (_, pat) in enumerate(SECTION_PATTERNS)),
+    re.IGNORECASE,
+)
 # 若文本中找不到明确分段，则用关键词粗抽取（截断到下一个节标题）
 NEXT_SECTION_RE = re.compile(r"【[^】]{1,20}】")
+PREG_FORBID_RE = re.compile(r"(禁用|绝对禁用|禁止使用)")
+PREG_CAUTION_RE = re.compile(r"(慎用|权衡利弊|风险.*收益)")
+WS_RE = re.compile(r"\s+")
+# 连接池：与 --workers 的线程并发匹配，长连接复用避免每次请求重新 TLS 握手
+HTTP_LIMITS = httpx.Limits(max_connections=32, max_keepalive_connections=32)
+# 离线 PDF 只解析前 N 页（说明书通常很短），给病态 PDF 的耗时设上限；<=0 表示不限
+PDF_MAXPAGES = 50
+# DrugBank 批量查询每次最多携带的药名数
+DRUGBANK_BATCH_SIZE = 50
+# DrugBank 药物相互作用合并后的字符上限（按总长度截断，而非条数，便于控制下游 token 预算）
+INTERACTIONS_MAX_CHARS = 4000
+# HTML 统一先经 ensure_utf8 解码，再以 UTF-8 字节交给 lxml（规避页面内残留的编码声明）
+HTML_PARSER = lxml_html.HTMLParser(encoding="utf-8")
+# chardet 为纯 Python 实现、耗时与输入长度成正比：只取前缀判断编码即可
+ENCODING_SNIFF_BYTES = 64 * 1024
+
+# 输出表头（与 load_drugs.py 的中文列名映射一致）
+EXCEL_COLUMNS = ["药品名称", "适应症", "禁忌症", "药物相互作用", "妊娠分级", "来源"]
 
 # ---------------------------
 # 数据结构
@@ -83,14 +121,150 @@ class DrugRecord:
     pregnancy_category: Optional[str] = None
     source: Optional[str] = None
 
+
+# 说明书字段名 → DrugRecord 属性
+FIELD_ATTRS = {
+    "适应症": "indications",
+    "禁忌症": "contraindications",
+    "药物相互作用": "interactions",
+    "妊娠分级": "pregnancy_category",
+}
+ALL_FIELDS = frozenset(FIELD_ATTRS)
+
+
+def _missing_fields(rec: DrugRecord) -> Set[str]:
+    """返回记录中仍为空的字段名集合（空集合表示四个字段均已填充）。"""
+    return {key for key, attr in FIELD_ATTRS.items() if not getattr(rec, attr)}
+
+# ---------------------------
+# 限速（令牌桶）
+# ---------------------------
+class TokenBucket:
+    """
+    线程安全的令牌桶：每秒补充 rate 个令牌，最多积攒 capacity 个。
+    acquire() 只在桶空时阻塞，空闲之后的少量突发请求不必等待；
+    多线程共享同一个桶，即为该主机唯一的限速依据。
+    """
+
+    def __init__(self, rate: float, capacity: int = 5):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._stamp = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self) -> None:
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._stamp) * self.rate)
+                self._stamp = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+# ---------------------------
+# 持久化 HTTP 缓存（SQLite）
+# ---------------------------
+class HTTPCache:
+    """
+    以 (method, url, params) 的 blake2b 摘要为键，把响应体存入 SQLite。
+    - NMPA：缓存原始 HTML 字节；DrugBank：缓存解析后的 JSON
+    - 仅按 TTL 失效；ttl_days <= 0 表示永不过期
+    - 多线程共享同一连接，读写由锁串行化
+    """
+
+    def __init__(self, path: str, ttl_days: float = 30.0):
+        folder = os.path.dirname(os.path.abspath(path))
+        os.makedirs(folder, exist_ok=True)
+        self.ttl_sec = ttl_days * 86400
+        self._lock = threading.Lock()
+        self._con = sqlite3.connect(path, check_same_thread=False)
+        self._con.execute("PRAGMA journal_mode=WAL")
+        self._con.execute(
+            "CREATE TABLE IF NOT EXISTS cache("
+            "key TEXT PRIMARY KEY, body BLOB, fetched_at INT, status INT)"
+        )
+        self._con.commit()
+
+    @staticmethod
+    def make_key(method: str, url: str, params: Optional[dict] = None) -> str:
+        raw = json.dumps([method, url, params or {}], ensure_ascii=False, sort_keys=True)
+        return hashlib.blake2b(raw.encode("utf-8"), digest_size=16).hexdigest()
+
+    def get(self, key: str) -> Optional[bytes]:
+        with self._lock:
+            row = self._con.execute(
+                "SELECT body, fetched_at FROM cache WHERE key = ?", (key,)
+            ).fetchone()
+        if not row:
+            return None
+        body, fetched_at = row
+        if self.ttl_sec > 0 and time.time() - fetched_at > self.ttl_sec:
+            return None
+        return bytes(body)
+
+    def put(self, key: str, body: bytes, status: int = 200) -> None:
+        with self._lock:
+            self._con.execute(
+                "INSERT OR REPLACE INTO cache(key, body, fetched_at, status) VALUES (?, ?, ?, ?)",
+                (key, sqlite3.Binary(body), int(time.time()), status),
+            )
+            self._con.commit()
+
+    def get_json(self, key: str):
+        body = self.get(key)
+        return json.loads(body) if body is not None else None
+
+    def put_json(self, key: str, value) -> None:
+        self.put(key, json.dumps(value, ensure_ascii=False).encode("utf-8"))
+
+    def close(self) -> None:
+        with self._lock:
+            self._con.close()
+
+
+def cached_get(kind: str):
+    """
+    装饰客户端的 `_get(target, params)`：命中 self.cache 则直接返回，不发请求也不重试。
+    kind="bytes" 缓存原始响应体；kind="json" 缓存 JSON 对象。
+    self.cache 为 None 时直通原函数。
+    """
+    def deco(fn):
+        @functools.wraps(fn)
+        def wrapper(self, target: str, params: Optional[dict] = None):
+            cache: Optional[HTTPCache] = getattr(self, "cache", None)
+            if cache is None:
+                return fn(self, target, params)
+            key = HTTPCache.make_key("GET", self._url(target), params)
+            if kind == "json":
+                value = cache.get_json(key)
+                if value is not None:
+                    return value
+                value = fn(self, target, params)
+                cache.put_json(key, value)
+                return value
+            body = cache.get(key)
+            if body is not None:
+                return body
+            value = fn(self, target, params)
+            cache.put(key, value)
+            return value
+        return wrapper
+    return deco
+
+
 # ---------------------------
 # 工具函数
 # ---------------------------
 def ensure_utf8(text_bytes: bytes) -> str:
-    """尽量检测编码并转为 UTF-8 字符串"""
+    """尽量检测编码并转为 UTF-8 字符串（仅用前 64KB 检测，再整体解码）"""
     if not isinstance(text_bytes, (bytes, bytearray)):
         return str(text_bytes)
-    det = chardet.detect(text_bytes)
+    det = chardet.detect(text_bytes[:ENCODING_SNIFF_BYTES])
     enc = det.get("encoding") or "utf-8"
     try:
         return text_bytes.decode(enc, errors="ignore")
@@ -98,48 +272,111 @@ def ensure_utf8(text_bytes: bytes) -> str:
         return text_bytes.decode("utf-8", errors="ignore")
 
 
-def slice_section(text: str, start_pat: str) -> Optional[str]:
+def _heading_table(text: str) -> Tuple[List[int], List[int]]:
+    """一次扫描全文所有 '【...】' 标题，返回 (起点列表, 终点列表)，均按位置递增。"""
+    starts, ends = [], []
+    for m in NEXT_SECTION_RE.finditer(text):
+        starts.append(m.start())
+        ends.append(m.end())
+    return starts, ends
+
+
+def _next_heading(text: str, pos: int, table: Optional[Tuple[List[int], List[int]]] = None) -> Optional[int]:
+    """pos 之后第一个 '【...】' 标题的起点；有标题表时二分查找，不再重复扫描文本。"""
+    if table is not None:
+        starts, ends = table
+        i = bisect.bisect_left(starts, pos)
+        # pos 落在某个标题内部时，表中可能漏掉与之重叠的标题，回退到正则以保持结果一致
+        if not (i > 0 and ends[i - 1] > pos):
+            return starts[i] if i < len(starts) else None
+    nxt = NEXT_SECTION_RE.search(text, pos)
+    return nxt.start() if nxt else None
+
+
+def _section_body(text: str, start: int, table: Optional[Tuple[List[int], List[int]]] = None) -> Optional[str]:
+    """取 text[start:] 直到下一个 '【...】' 标题（不复制整段尾部）。"""
+    end = _next_heading(text, start, table)
+    body = text[start:end] if end is not None else text[start:]
+    return body.strip() or None
+
+
+def html_to_text(html: str, article_only: bool = False) -> str:
+    """
+    HTML → 纯文本（直接用 lxml，不经 BeautifulSoup）。
+    - article_only：优先取说明书正文容器 <div class="article"> / id="article"，找不到则用整页
+    - 去掉 script/style/注释，文本节点以换行拼接并合并连续空行
+    """
+    root = lxml_html.document_fromstring(html.encode("utf-8"), parser=HTML_PARSER)
+    if article_only:
+        found = (
+            root.xpath("//div[contains(concat(' ', normalize-space(@class), ' '), ' article ')]")
+            or root.xpath("//*[@id='article']")
+        )
+        if found:
+            root = found[0]
+    for el in root.xpath(".//script | .//style | .//comment()"):
+        el.drop_tree()
+    # 合并连续换行：split + filter 比正则替换更快
+    text = "\n".join(filter(None, "\n".join(root.itertext()).split("\n")))
+    return text.strip()
+
+
+def slice_section(text: str, start_pat) -> Optional[str]:
     """
     从说明书全文中按节标题粗抽取内容：
-    - 定位 start_pat
+    - 定位 start_pat（字符串或已编译正则）
     - 截断到下一个 '【...】' 标题
     """
-    m = re.search(start_pat, text, flags=re.IGNORECASE)
+    pat = start_pat if isinstance(start_pat, re.Pattern) else re.compile(start_pat, re.IGNORECASE)
+    m = pat.search(text)
     if not m:
         return None
-    start = m.end()
-    tail = text[start:]
-    nxt = NEXT_SECTION_RE.search(tail)
-    if nxt:
-        body = tail[:nxt.start()]
-    else:
-        body = tail
+    body = _section_body(text, m.end())
     # 清理多余空白
-    body = re.sub(r"\s+", " ", body).strip()
-    return body if body else None
+    return WS_RE.sub(" ", body).strip() if body else None
 
 
-def parse_cn_label_text(full_text: str) -> Dict[str, Optional[str]]:
-    """从中文说明书全文中解析目标字段"""
+def parse_cn_label_text(full_text: str, want: Optional[Set[str]] = None) -> Dict[str, Optional[str]]:
+    """
+    从中文说明书全文中解析目标字段。
+    want 指定需要的字段（默认全部）；其余字段不做切片/映射，保持 None，找齐后即停止扫描。
+    """
+    want = ALL_FIELDS if want is None else want
     out = {
         "适应症": None,
         "禁忌症": None,
         "药物相互作用": None,
         "妊娠分级": None,
     }
-    text = re.sub(r"\s+", " ", full_text)
-    for key, pat in SECTION_PATTERNS:
-        chunk = slice_section(text, pat)
-        if chunk and key != "妊娠分级":
-            out[key] = chunk
+    # 全文只归一化一次空白，各节正文切出后仅需 strip
+    text = WS_RE.sub(" ", full_text)
+
+    # 单次线性扫描：记录每个字段首次出现的位置（与逐个 re.search 取首个匹配一致）
+    starts: Dict[str, int] = {}
+    if want:
+        for m in SECTION_SCAN_RE.finditer(text):
+            key = SECTION_PATTERNS[int(m.lastgroup[1:])][0]
+            if key in want and key not in starts:
+                starts[key] = m.end()
+                if len(starts) == len(want):
+                    break
+
+    # 标题偏移表：各字段的截止位置统一二分查得
+    table = _heading_table(text) if starts else None
+    for key, start in starts.items():
+        if key != "妊娠分级":
+            out[key] = _section_body(text, start, table)
+
+    if "妊娠分级" not in want:
+        return out
 
     # 妊娠分级：大陆说明书通常不提供 A/B/C/D/X；若文本中出现类似“孕妇禁用/慎用”，可粗映射；否则“未标注”
-    preg_txt = slice_section(text, SECTION_PATTERNS[-1][1])
+    preg_txt = _section_body(text, starts["妊娠分级"], table) if "妊娠分级" in starts else None
     if preg_txt:
         # 简单启发式映射（可按需强化）
-        if re.search(r"(禁用|绝对禁用|禁止使用)", preg_txt):
+        if PREG_FORBID_RE.search(preg_txt):
             out["妊娠分级"] = "禁用（未标注分级）"
-        elif re.search(r"(慎用|权衡利弊|风险.*收益)", preg_txt):
+        elif PREG_CAUTION_RE.search(preg_txt):
             out["妊娠分级"] = "慎用（未标注分级）"
         else:
             out["妊娠分级"] = "未标注"
@@ -163,22 +400,33 @@ class NMPAClient:
     如遇到前端结构变化、反爬增强、需要 POST token 等情况，请根据实际页面更新 `search_endpoint` 与 CSS 选择器。
     """
 
-    def __init__(self, rate_sec: float = 1.2):
-        self.sess = requests.Session()
+    def __init__(self, rate_sec: float = 1.2, cache: Optional[HTTPCache] = None):
+        self.sess = httpx.Client(
+            http2=True, timeout=15, headers=HEADERS, limits=HTTP_LIMITS, follow_redirects=True
+        )
         self.rate_sec = rate_sec
         self.base = "https://www.nmpa.gov.cn/datasearch/"
+        self.cache = cache
+        # 多线程共享的令牌桶：按主机限速，平均每 rate_sec 秒一个请求，只在超出预算时等待
+        self._bucket = TokenBucket(rate=1.0 / rate_sec) if rate_sec > 0 else None
+
+    def _url(self, url: str) -> str:
+        return url
 
+    @cached_get("bytes")
     @retry(
         reraise=True,
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=1, max=8),
-        retry=retry_if_exception_type((requests.RequestException,))
+        retry=retry_if_exception_type((httpx.HTTPError,))
     )
-    def _get(self, url: str, params: Optional[dict] = None) -> requests.Response:
-        resp = self.sess.get(url, headers=HEADERS, params=params, timeout=15)
+    def _get(self, url: str, params: Optional[dict] = None) -> bytes:
+        if self._bucket is not None:
+            self._bucket.acquire()
+        resp = self.sess.get(url, params=params)
         if resp.status_code != 200:
-            raise requests.RequestException(f"HTTP {resp.status_code}")
-        return resp
+            raise httpx.HTTPStatusError(f"HTTP {resp.status_code}", request=resp.request, response=resp)
+        return resp.content
 
     def search_label_urls(self, drug_name: str) -> List[str]:
         """
@@ -192,7 +440,6 @@ class NMPAClient:
         # 因此在实际项目中建议针对当前 NMPA 站点调试具体接口（如 /search?keyword=xxx）。
         try:
             _ = self._get(search_url)
-            time.sleep(self.rate_sec)
         except Exception:
             return []
 
@@ -202,17 +449,11 @@ class NMPAClient:
     def fetch_label_text(self, url: str) -> Optional[str]:
         """抓取说明书详情页全文文本（HTML → 文本）。"""
         try:
-            r = self._get(url)
-            time.sleep(self.rate_sec)
-            html = ensure_utf8(r.content)
-            soup = BeautifulSoup(html, "lxml")
-
+            raw = self._get(url)
+            html = ensure_utf8(raw)
             # 通用提取：找正文容器
             # 说明书常见在 <div class="article"> 或者 id="article", 根据实际页面结构调整
-            container = soup.find("div", class_="article") or soup.find(id="article") or soup
-            text = container.get_text(separator="\n")
-            text = re.sub(r"\n+", "\n", text)
-            return text.strip()
+            return html_to_text(html, article_only=True)
         except Exception:
             return None
 
@@ -227,14 +468,20 @@ class DrugBankClient:
     - 具体 API 端点与字段名会因你的许可证版本不同而异。此处演示一种常见 REST 风格：
         GET /v1/drugs?name=<query>
         GET /v1/drugs/<id>
+        POST /v1/drugs/batch {"names": [...]}   （若许可证支持；不支持时自动退回逐个查询）
     - 若你的接口是 GraphQL，请自行替换实现。
     """
 
-    def __init__(self):
+    def __init__(self, cache: Optional[HTTPCache] = None):
         load_dotenv()
         self.api_key = os.getenv("DRUGBANK_API_KEY")
         self.base = os.getenv("DRUGBANK_BASE", "https://api.drugbank.com/v1")
-        self.sess = requests.Session()
+        self.cache = cache
+        # None=未探测；False=服务端不支持批量端点（404/405/501），之后不再尝试
+        self.batch_supported: Optional[bool] = None
+        self.sess = httpx.Client(
+            http2=True, timeout=20, limits=HTTP_LIMITS, follow_redirects=True
+        )
         if self.api_key:
             self.sess.headers.update({
                 "Authorization": f"Bearer {self.api_key}",
@@ -245,17 +492,23 @@ class DrugBankClient:
     def available(self) -> bool:
         return bool(self.api_key)
 
+    def _url(self, path: str) -> str:
+        return self.base.rstrip("/") + "/" + path.lstrip("/")
+
+    @cached_get("json")
     @retry(
         reraise=True,
         stop=stop_after_attempt(3),
         wait=wait_exponential(multiplier=1, min=1, max=8),
-        retry=retry_if_exception_type((requests.RequestException,))
+        retry=retry_if_exception_type((httpx.HTTPError,))
     )
     def _get(self, path: str, params: Optional[dict] = None) -> dict:
-        url = self.base.rstrip("/") + "/" + path.lstrip("/")
-        resp = self.sess.get(url, params=params, timeout=20)
+        url = self._url(path)
+        resp = self.sess.get(url, params=params)
         if resp.status_code != 200:
-            raise requests.RequestException(f"DrugBank HTTP {resp.status_code}: {resp.text[:200]}")
+            raise httpx.HTTPStatusError(
+                f"DrugBank HTTP {resp.status_code}: {resp.text[:200]}", request=resp.request, response=resp
+            )
         return resp.json()
 
     def query_by_name(self, name: str) -> Optional[dict]:
@@ -277,6 +530,96 @@ class DrugBankClient:
         except Exception:
             return None
 
+    @retry(
+        reraise=True,
+        stop=stop_after_attempt(3),
+        wait=wait_exponential(multiplier=1, min=1, max=8),
+        retry=retry_if_exception_type((httpx.TransportError,))
+    )
+    def _post(self, path: str, payload: dict):
+        resp = self.sess.post(self._url(path), json=payload)
+        if resp.status_code != 200:
+            raise httpx.HTTPStatusError(
+                f"DrugBank HTTP {resp.status_code}: {resp.text[:200]}", request=resp.request, response=resp
+            )
+        return resp.json()
+
+    def _cached_detail(self, name: str) -> Optional[dict]:
+        """只读缓存走一遍 query_by_name 的两步（名称搜索 → 详情），任一步未命中返回 None，不发请求。"""
+        if self.cache is None:
+            return None
+        j = self.cache.get_json(HTTPCache.make_key("GET", self._url("drugs"), {"name": name}))
+        if not j:
+            return None
+        first = j[0] if isinstance(j, list) else j
+        drug_id = first.get("id") or first.get("drugbank_id")
+        if not drug_id:
+            return first
+        return self.cache.get_json(HTTPCache.make_key("GET", self._url(f"drugs/{drug_id}")))
+
+    def _remember(self, name: str, detail: dict) -> None:
+        """把批量结果写进 query_by_name 读取的同一组缓存键，下次（含逐个查询）直接命中。"""
+        if self.cache is None:
+            return
+        self.cache.put_json(HTTPCache.make_key("GET", self._url("drugs"), {"name": name}), [detail])
+        drug_id = detail.get("id") or detail.get("drugbank_id")
+        if drug_id:
+            self.cache.put_json(HTTPCache.make_key("GET", self._url(f"drugs/{drug_id}")), detail)
+
+    def _query_batch(self, names: List[str]) -> Dict[str, dict]:
+        """
+        一次请求查询一组药名（最多 DRUGBANK_BATCH_SIZE 个）。
+        按返回项的 query/name 字段（忽略大小写）对回请求的药名；对不上的由调用方逐个补查。
+        """
+        j = self._post("drugs/batch", {"names": names})
+        items = (j.get("drugs") or j.get("results") or []) if isinstance(j, dict) else j
+        wanted = {n.lower(): n for n in names}
+        out: Dict[str, dict] = {}
+        for it in items or []:
+            if not isinstance(it, dict):
+                continue
+            key = str(it.get("query") or it.get("name") or "").lower()
+            if key in wanted:
+                out[wanted[key]] = it
+        return out
+
+    def query_by_names(self, names: List[str], max_workers: int = 8) -> Dict[str, dict]:
+        """
+        批量查询：先查本地缓存；未命中的按 DRUGBANK_BATCH_SIZE 分块走批量端点，⌈N/50⌉ 次往返
+        （结果写回缓存）；批量端点不可用或未返回的药名，再并发逐个 query_by_name。
+        返回 {药名: 详情}，查不到的药名不出现在结果中。
+        """
+        out: Dict[str, dict] = {}
+        pending: List[str] = []
+        for n in dict.fromkeys(names):
+            hit = self._cached_detail(n)
+            if hit:
+                out[n] = hit
+            else:
+                pending.append(n)
+        if pending and self.batch_supported is not False:
+            for i in range(0, len(pending), DRUGBANK_BATCH_SIZE):
+                try:
+                    got = self._query_batch(pending[i:i + DRUGBANK_BATCH_SIZE])
+                    for n, detail in got.items():
+                        self._remember(n, detail)
+                    out.update(got)
+                    self.batch_supported = True
+                except httpx.HTTPStatusError as e:
+                    if e.response.status_code in (404, 405, 501):
+                        self.batch_supported = False
+                        break
+                except Exception:
+                    continue
+
+        missing = [n for n in pending if n not in out]
+        if missing:
+            with ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+                for name, detail in zip(missing, ex.map(self.query_by_name, missing)):
+                    if detail:
+                        out[name] = detail
+        return out
+
     @staticmethod
     def pick_fields(detail: dict) -> Dict[str, Optional[str]]:
         """
@@ -298,13 +641,20 @@ class DrugBankClient:
         # interactions 可能在 "drug_interactions" 数组中
         intr_list = get_nested(detail, "drug_interactions", default=None)
         if isinstance(intr_list, list) and intr_list:
-            # 合并简要描述
-            snippets = []
-            for it in intr_list[:30]:  # 截前 N 条以免过长
+            # 合并简要描述，累计长度（含分隔符）超过 INTERACTIONS_MAX_CHARS 即停止
+            snippets, total = [], 0
+            for it in intr_list:
                 desc = it.get("description") or it.get("text")
+                if not desc:
+                    continue
                 partner = it.get("name") or it.get("drug") or ""
-                if desc:
-                    snippets.append(f"{partner}: {desc}")
+                snippet = f"{partner}: {desc}"
+                total += len(snippet) + (1 if snippets else 0)
+                if total > INTERACTIONS_MAX_CHARS:
+                    if not snippets:  # 单条即超限：截断保留
+                        snippets.append(snippet[:INTERACTIONS_MAX_CHARS])
+                    break
+                snippets.append(snippet)
             if snippets:
                 interactions = "；".join(snippets)
 
@@ -323,50 +673,94 @@ class DrugBankClient:
 # ---------------------------
 # 离线说明书解析（PDF/HTML）
 # ---------------------------
-def read_pdf_text(path: str) -> str:
+def _pdfium_text(path: str, maxpages: int = PDF_MAXPAGES) -> str:
+    """PDFium（C++ 内核）逐页抽取文本，速度远快于纯 Python 的 pdfminer。"""
+    pdf = pdfium.PdfDocument(path)
     try:
-        # 优先 pdfminer（版式更稳定）
-        txt = pdf_extract_text(path) or ""
-        if not txt:
-            # 回退 PyPDF2
-            reader = PdfReader(path)
-            buf = []
-            for page in reader.pages:
-                buf.append(page.extract_text() or "")
-            txt = "\n".join(buf)
-        return txt
-    except Exception:
-        return ""
+        buf = []
+        n = len(pdf) if maxpages <= 0 else min(len(pdf), maxpages)
+        for i in range(n):
+            page = pdf[i]
+            textpage = page.get_textpage()
+            buf.append(textpage.get_text_range())
+            textpage.close()
+            page.close()
+        return "\n".join(buf)
+    finally:
+        pdf.close()
+
+
+def _pdfminer_text(path: str, maxpages: int = PDF_MAXPAGES) -> str:
+    """
+    pdfminer 回退路径：laparams=None 关闭版式分析（大型多栏 PDF 上最容易卡死的一步），
+    并以 maxpages 限制页数，使最坏耗时与页数成正比。
+    注意 high_level.extract_text 会把 None 换成默认 LAParams()，故这里用 extract_text_to_fp。
+    """
+    out = StringIO()
+    with open(path, "rb") as f:
+        extract_text_to_fp(f, out, laparams=None, maxpages=max(0, maxpages))
+    return out.getvalue()
+
+
+def _pypdf2_text(path: str, maxpages: int = PDF_MAXPAGES) -> str:
+    reader = PdfReader(path)
+    pages = reader.pages if maxpages <= 0 else reader.pages[:maxpages]
+    buf = []
+    for page in pages:
+        buf.append(page.extract_text() or "")
+    return "\n".join(buf)
+
+
+def read_pdf_text(path: str, maxpages: int = PDF_MAXPAGES) -> str:
+    # 优先 pypdfium2；出错或抽不到文字时依次回退 pdfminer、PyPDF2（均只读前 maxpages 页）
+    for extract in (_pdfium_text, _pdfminer_text, _pypdf2_text):
+        try:
+            txt = extract(path, maxpages)
+        except Exception:
+            continue
+        if txt and txt.strip():
+            return txt
+    return ""
 
 
 def read_html_text(path: str) -> str:
     try:
         with open(path, "rb") as f:
             raw = f.read()
-        html = ensure_utf8(raw)
-        soup = BeautifulSoup(html, "lxml")
-        text = soup.get_text(separator="\n")
-        text = re.sub(r"\n+", "\n", text)
-        return text.strip()
+        return html_to_text(ensure_utf8(raw))
     except Exception:
         return ""
 
 
-def scan_offline_label(drug_name: str, folder: Optional[str]) -> Optional[str]:
+def _index_offline_dir(folder: Optional[str]) -> List[Tuple[str, str]]:
+    """
+    一次性扫描离线说明书目录，返回 [(小写文件名, 完整路径)]。
+    已按“HTML 优先，其次 PDF；同类按路径”全局排序，逐药品过滤后无需再排序。
+    """
     if not folder or not os.path.isdir(folder):
-        return None
-    # 以药名包含匹配
-    cand = []
-    for fn in os.listdir(folder):
-        if re.search(re.escape(drug_name), fn, flags=re.IGNORECASE):
-            cand.append(os.path.join(folder, fn))
-    # 优先 HTML，其次 PDF
-    cand_sorted = sorted(cand, key=lambda p: (0 if p.lower().endswith((".html", ".htm")) else 1, p))
+        return []
+    index = []
+    with os.scandir(folder) as it:
+        for entry in it:
+            if entry.is_file():
+                index.append((entry.name.lower(), entry.path))
+    index.sort(key=lambda item: (0 if item[0].endswith((".html", ".htm")) else 1, item[1]))
+    return index
+
+
+def scan_offline_label(
+    drug_name: str,
+    index: List[Tuple[str, str]],
+    pdf_maxpages: int = PDF_MAXPAGES
+) -> Optional[str]:
+    """在预建索引中按药名包含（忽略大小写）匹配离线说明书，返回首个有效文本。"""
+    drug_lower = drug_name.lower()
+    cand_sorted = [p for lname, p in index if drug_lower in lname]
     for p in cand_sorted:
         if p.lower().endswith((".html", ".htm")):
             txt = read_html_text(p)
         elif p.lower().endswith(".pdf"):
-            txt = read_pdf_text(p)
+            txt = read_pdf_text(p, pdf_maxpages)
         else:
             continue
         if txt and len(txt) > 50:
@@ -377,89 +771,179 @@ def scan_offline_label(drug_name: str, folder: Optional[str]) -> Optional[str]:
 # ---------------------------
 # 主流程
 # ---------------------------
+def _nmpa_record(name: str, nmpa: NMPAClient, use_nmpa_online: bool) -> DrugRecord:
+    """阶段一：NMPA 在线说明书（若可定制到有效搜索接口）。"""
+    rec = DrugRecord(name=name)
+    if use_nmpa_online:
+        # 这里的 search 是占位，默认返回空（需你根据当前站点接口定制）
+        urls = nmpa.search_label_urls(name)
+        text = None
+        for u in urls:
+            text = nmpa.fetch_label_text(u)
+            if text:
+                break
+        if text:
+            parsed = parse_cn_label_text(text)
+            rec.indications = parsed["适应症"]
+            rec.contraindications = parsed["禁忌症"]
+            rec.interactions = parsed["药物相互作用"]
+            rec.pregnancy_category = parsed["妊娠分级"]
+            rec.source = "NMPA说明书（在线）"
+    return rec
+
+
+def _complete_record(
+    rec: DrugRecord,
+    detail: Optional[dict],
+    offline_index: List[Tuple[str, str]],
+    pdf_maxpages: int = PDF_MAXPAGES
+) -> DrugRecord:
+    """阶段三：合并 DrugBank 详情（阶段二批量取得）→ 离线兜底 → 缺省值。"""
+    # 其次：DrugBank（仍有缺口的药品才会被查询）
+    if detail and _missing_fields(rec):
+        picked = DrugBankClient.pick_fields(detail)
+        # 仅填补缺口（保留已从 NMPA 得到的内容）
+        rec.indications = rec.indications or picked["适应症"]
+        rec.contraindications = rec.contraindications or picked["禁忌症"]
+        rec.interactions = rec.interactions or picked["药物相互作用"]
+        rec.pregnancy_category = rec.pregnancy_category or picked["妊娠分级"]
+        rec.source = (rec.source + " + DrugBank") if rec.source else "DrugBank"
+
+    # 兜底：离线 NMPA 文件夹（仅当四个字段全部缺失）
+    missing = _missing_fields(rec)
+    if missing == ALL_FIELDS:
+        text = scan_offline_label(rec.name, offline_index, pdf_maxpages)
+        if text:
+            parsed = parse_cn_label_text(text, want=missing)
+            rec.indications = parsed["适应症"]
+            rec.contraindications = parsed["禁忌症"]
+            rec.interactions = parsed["药物相互作用"]
+            rec.pregnancy_category = parsed["妊娠分级"]
+            rec.source = "NMPA说明书（离线）"
+
+    # 若仍缺字段，填上“未标注”
+    if not rec.indications: rec.indications = "未标注"
+    if not rec.contraindications: rec.contraindications = "未标注"
+    if not rec.interactions: rec.interactions = "未标注"
+    if not rec.pregnancy_category: rec.pregnancy_category = "未标注"
+    if not rec.source: rec.source = "未获取（请补充源）"
+
+    return rec
+
+
 def build_records(
     names: List[str],
     use_nmpa_online: bool = True,
     nmpa_offline_dir: Optional[str] = None,
-    use_drugbank: bool = True
+    use_drugbank: bool = True,
+    max_workers: int = 8,
+    cache: Optional[HTTPCache] = None,
+    pdf_maxpages: int = PDF_MAXPAGES,
+    nmpa: Optional[NMPAClient] = None,
+    db: Optional[DrugBankClient] = None,
+    offline_index: Optional[List[Tuple[str, str]]] = None
 ) -> List[DrugRecord]:
-
-    nmpa = NMPAClient()
-    db = DrugBankClient()
+    """
+    三阶段抽取：
+      1) 并发抓取 NMPA 在线说明书（请求频率由 NMPAClient 内部统一节流）
+      2) 对仍有缺口的药品一次性批量查询 DrugBank
+      3) 并发合并 DrugBank 结果、离线兜底
+    各药品之间相互独立且以网络/磁盘 I/O 为主，因此用线程池执行。
+    返回顺序与 names 一致。cache 非空时两个客户端共用同一持久化缓存。
+    分批调用时可传入同一组 nmpa/db 客户端，复用连接池与限速状态；
+    offline_index 为预先建好的 _index_offline_dir 结果，传入后不再重复扫描离线目录。
+    """
+    nmpa = nmpa or NMPAClient(cache=cache)
+    db = db or DrugBankClient(cache=cache)
     if use_drugbank and not db.available():
         use_drugbank = False
 
-    records: List[DrugRecord] = []
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as ex:
+        records: List[DrugRecord] = list(ex.map(lambda n: _nmpa_record(n, nmpa, use_nmpa_online), names))
 
-    for name in names:
-        rec = DrugRecord(name=name)
-        # 优先：NMPA 在线（若可定制到有效搜索接口）
-        if use_nmpa_online:
-            # 这里的 search 是占位，默认返回空（需你根据当前站点接口定制）
-            urls = nmpa.search_label_urls(name)
-            text = None
-            for u in urls:
-                text = nmpa.fetch_label_text(u)
-                if text:
-                    break
-            if text:
-                parsed = parse_cn_label_text(text)
-                rec.indications = parsed["适应症"]
-                rec.contraindications = parsed["禁忌症"]
-                rec.interactions = parsed["药物相互作用"]
-                rec.pregnancy_category = parsed["妊娠分级"]
-                rec.source = "NMPA说明书（在线）"
-
-        # 其次：DrugBank（若可用且仍有缺口）
-        if use_drugbank and not all([rec.indications, rec.contraindications, rec.interactions, rec.pregnancy_category]):
-            detail = db.query_by_name(name)
-            if detail:
-                picked = db.pick_fields(detail)
-                # 仅填补缺口（保留已从 NMPA 得到的内容）
-                rec.indications = rec.indications or picked["适应症"]
-                rec.contraindications = rec.contraindications or picked["禁忌症"]
-                rec.interactions = rec.interactions or picked["药物相互作用"]
-                rec.pregnancy_category = rec.pregnancy_category or picked["妊娠分级"]
-                rec.source = (rec.source + " + DrugBank") if rec.source else "DrugBank"
-
-        # 兜底：离线 NMPA 文件夹
-        if not any([rec.indications, rec.contraindications, rec.interactions, rec.pregnancy_category]):
-            text = scan_offline_label(name, nmpa_offline_dir)
-            if text:
-                parsed = parse_cn_label_text(text)
-                rec.indications = parsed["适应症"]
-                rec.contraindications = parsed["禁忌症"]
-                rec.interactions = parsed["药物相互作用"]
-                rec.pregnancy_category = parsed["妊娠分级"]
-                rec.source = "NMPA说明书（离线）"
-
-        # 若仍缺字段，填上“未标注”
-        if not rec.indications: rec.indications = "未标注"
-        if not rec.contraindications: rec.contraindications = "未标注"
-        if not rec.interactions: rec.interactions = "未标注"
-        if not rec.pregnancy_category: rec.pregnancy_category = "未标注"
-        if not rec.source: rec.source = "未获取（请补充源）"
-
-        records.append(rec)
+        details: Dict[str, dict] = {}
+        if use_drugbank:
+            # 四个字段已由 NMPA 填满的药品不再查询 DrugBank
+            gaps = [r.name for r in records if _missing_fields(r)]
+            if gaps:
+                details = db.query_by_names(gaps, max_workers=max_workers)
+
+        if offline_index is None:
+            offline_index = _index_offline_dir(nmpa_offline_dir)
+        records = list(ex.map(
+            lambda r: _complete_record(r, details.get(r.name), offline_index, pdf_maxpages), records
+        ))
 
     return records
 
 
-def save_to_excel(records: List[DrugRecord], out_path: str):
-    os.makedirs(os.path.dirname(out_path), exist_ok=True)
-    rows = []
-    for r in records:
-        rows.append({
-            "药品名称": r.name,
-            "适应症": r.indications,
-            "禁忌症": r.contraindications,
-            "药物相互作用": r.interactions,
-            "妊娠分级": r.pregnancy_category,
-            "来源": r.source
-        })
-    df = pd.DataFrame(rows, columns=["药品名称","适应症","禁忌症","药物相互作用","妊娠分级","来源"])
-    df.to_excel(out_path, index=False)
-    print(f"✅ 已写出 {len(df)} 条记录 → {out_path}")
+def save_to_excel(records: List[DrugRecord], out_path: str, parquet: bool = False):
+    """
+    写出 Excel（xlsxwriter constant_memory：逐行落盘，内存占用与记录数无关）。
+    注意 DataFrame.to_excel 按列输出单元格，与 constant_memory 不兼容（会丢数据），因此这里直接逐行写。
+    parquet=True 时另写同名 .parquet（zstd 压缩），供下游程序读取。
+    """
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    wb = xlsxwriter.Workbook(out_path, {
+        "constant_memory": True,
+        "strings_to_formulas": False,
+        "strings_to_urls": False,
+    })
+    ws = wb.add_worksheet()
+    ws.write_row(0, 0, EXCEL_COLUMNS)
+    for i, r in enumerate(records, start=1):
+        ws.write_row(i, 0, (r.name, r.indications, r.contraindications,
+                            r.interactions, r.pregnancy_category, r.source))
+    wb.close()
+    print(f"✅ 已写出 {len(records)} 条记录 → {out_path}")
+
+    if parquet:
+        pq_path = os.path.splitext(out_path)[0] + ".parquet"
+        records_to_frame(records).to_parquet(pq_path, index=False, compression="zstd")
+        print(f"✅ 已写出 Parquet → {pq_path}")
+
+
+def records_to_frame(records: List[DrugRecord]) -> pd.DataFrame:
+    # 直接按列构造，避免 pandas 逐行推断 dict 记录
+    return pd.DataFrame({
+        "药品名称": [r.name for r in records],
+        "适应症": [r.indications for r in records],
+        "禁忌症": [r.contraindications for r in records],
+        "药物相互作用": [r.interactions for r in records],
+        "妊娠分级": [r.pregnancy_category for r in records],
+        "来源": [r.source for r in records],
+    }, columns=EXCEL_COLUMNS, copy=False)
+
+
+def save_checkpoint(records: List[DrugRecord], path: str) -> None:
+    """写检查点 Parquet：先写临时文件再原子替换，进程中途崩溃也不会留下半个文件。"""
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    tmp = path + ".tmp"
+    records_to_frame(records).to_parquet(tmp, index=False, compression="zstd")
+    os.replace(tmp, path)
+
+
+def check_checkpoint_target(path: str) -> None:
+    """
+    开跑前校验检查点能否写出：pyarrow 可导入、目录可创建且可写。
+    检查点在后台线程写，失败不会中断主流程，因此必须在抓取开始前发现问题。
+    """
+    try:
+        import pyarrow  # noqa: F401
+    except ImportError:
+        raise SystemExit("❌ --checkpoint-every 需要 pyarrow：pip install pyarrow")
+    folder = os.path.dirname(os.path.abspath(path))
+    try:
+        os.makedirs(folder, exist_ok=True)
+    except OSError as e:
+        raise SystemExit(f"❌ 无法创建检查点目录 {folder}：{e}")
+    if not os.access(folder, os.W_OK):
+        raise SystemExit(f"❌ 检查点目录不可写：{folder}")
+
+
+def load_checkpoint(path: str) -> List[DrugRecord]:
+    df = pd.read_parquet(path, columns=EXCEL_COLUMNS)
+    return [DrugRecord(*row) for row in df.itertuples(index=False, name=None)]
 
 
 def load_names(path: str) -> List[str]:
@@ -475,6 +959,15 @@ def main():
     ap.add_argument("--nmpa-offline-dir", dest="nmpa_offline_dir", default=None, help="离线 NMPA 说明书目录（可选）")
     ap.add_argument("--no-nmpa-online", action="store_true", help="禁用 NMPA 在线检索")
     ap.add_argument("--no-drugbank", action="store_true", help="禁用 DrugBank API")
+    ap.add_argument("--pdf-maxpages", dest="pdf_maxpages", type=int, default=PDF_MAXPAGES,
+                    help="离线 PDF 最多解析的页数（<=0 不限）")
+    ap.add_argument("--workers", type=int, default=8, help="并发处理的药品数（线程数）")
+    ap.add_argument("--parquet", action="store_true", help="额外输出同名 .parquet（需 pyarrow）")
+    ap.add_argument("--checkpoint-every", dest="checkpoint_every", type=int, default=0,
+                    help="每处理 N 个药品在后台写一次 Parquet 检查点（0=关闭）")
+    ap.add_argument("--resume", action="store_true", help="从已有检查点恢复，跳过已完成的药品")
+    ap.add_argument("--cache-db", dest="cache_db", default=None, help="HTTP 响应缓存 SQLite 路径（可选，跨运行复用）")
+    ap.add_argument("--cache-ttl-days", dest="cache_ttl_days", type=float, default=30.0, help="缓存有效期（天），<=0 表示永不过期")
     args = ap.parse_args()
 
     names = load_names(os.path.expanduser(args.in_file))
@@ -483,15 +976,52 @@ def main():
 
     use_nmpa_online = not args.no_nmpa_online
     use_drugbank = not args.no_drugbank
+    cache = HTTPCache(os.path.expanduser(args.cache_db), ttl_days=args.cache_ttl_days) if args.cache_db else None
 
-    records = build_records(
-        names,
-        use_nmpa_online=use_nmpa_online,
-        nmpa_offline_dir=os.path.expanduser(args.nmpa_offline_dir) if args.nmpa_offline_dir else None,
-        use_drugbank=use_drugbank
-    )
-    save_to_excel(records, os.path.expanduser(args.out_file))
+    out_path = os.path.expanduser(args.out_file)
+    ckpt_path = os.path.splitext(out_path)[0] + ".checkpoint.parquet"
+    if args.checkpoint_every > 0:
+        check_checkpoint_target(ckpt_path)
+    records: List[DrugRecord] = []
+    if args.resume and os.path.isfile(ckpt_path):
+        records = load_checkpoint(ckpt_path)
+        done = {r.name for r in records}
+        names = [n for n in names if n not in done]
+        print(f"↩️ 从检查点恢复 {len(records)} 条记录，剩余 {len(names)} 个药品")
+
+    # 分批构建：每批完成后在后台线程写检查点，与下一批的网络抓取重叠
+    nmpa = NMPAClient(cache=cache)
+    db = DrugBankClient(cache=cache)
+    offline_dir = os.path.expanduser(args.nmpa_offline_dir) if args.nmpa_offline_dir else None
+    offline_index = _index_offline_dir(offline_dir)  # 离线目录只扫描一次，各批共用
+    step = args.checkpoint_every if args.checkpoint_every > 0 else max(1, len(names))
+    writer: Optional[threading.Thread] = None
+    for i in range(0, len(names), step):
+        records.extend(build_records(
+            names[i:i + step],
+            use_nmpa_online=use_nmpa_online,
+            nmpa_offline_dir=offline_dir,
+            use_drugbank=use_drugbank,
+            max_workers=args.workers,
+            pdf_maxpages=args.pdf_maxpages,
+            nmpa=nmpa,
+            db=db,
+            offline_index=offline_index
+        ))
+        if args.checkpoint_every > 0:
+            if writer is not None:
+                writer.join()  # 同一时刻只保留一个写线程，检查点按批次顺序覆盖
+            writer = threading.Thread(target=save_checkpoint, args=(list(records), ckpt_path))
+            writer.start()
+    if writer is not None:
+        writer.join()
 
+    if cache is not None:
+        cache.close()
+    save_to_excel(records, out_path, parquet=args.parquet)
+    # 正常完成后清理检查点，避免下次 --resume 误跳过
+    if os.path.isfile(ckpt_path):
+        os.remove(ckpt_path)
 
 if __name__ == "__main__":
     main()
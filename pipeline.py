@@ -18,12 +18,44 @@ Quick Start (from project root):
 Env Vars (tune generation or point to a different LLM):
     OLLAMA_BASE_URL   default http://localhost:11434
     LLM_MODEL         default qwen2:7b-instruct
-    LLM_NUM_CTX       optional context window size
-    LLM_TEMPERATURE   optional decoding temperature
+    LLM_NUM_CTX       context window size (default 16384; always sent to Ollama)
+    LLM_TEMPERATURE   optional decoding temperature (0 also enables the exact-repeat
+                      LLM cache, see llm_chat)
     LLM_TOP_P         optional nucleus sampling
     LLM_SEED          optional seed for reproducibility
 
+Warm-up (see warmup()):
+    CAREMIND_WARMUP   1 (default) = on import, load the model in the background
+                      so the first question doesn't wait for it; 0 = off
+
+No-evidence short cut:
+    CAREMIND_FAIL_FAST  1 = when retrieval finds no guideline snippet and no drug
+                        record, return a fixed "insufficient evidence" answer
+                        without calling the LLM; 0 (default) = always ask the LLM
+
+Concurrency (answer_async / llm_chat_async):
+    OLLAMA_NUM_PARALLEL  set on the *Ollama server*, not here: how many requests
+                         one loaded model serves at once (e.g. 4). Without it,
+                         concurrent requests simply queue on the server side.
+
+Prompt size (guideline snippets are trimmed to fit the model's context window):
+    LLM_NUM_CTX               also sets the prompt budget (default 16384 if unset)
+    CAREMIND_SNIPPET_TOKENS   optional hard cap per guideline snippet (default: none,
+                              the num_ctx budget is shared evenly across hits)
+
+Semantic answer cache (see SemanticCache; disable per call with use_cache=False
+or on the CLI with --no-cache):
+    CAREMIND_CACHE_THRESHOLD  cosine similarity needed for a hit (default 0.92)
+    CAREMIND_CACHE_TTL        seconds an entry stays valid (default 300)
+    CAREMIND_CACHE_SIZE       max entries before LRU eviction (default 4096); past
+                              1024 entries lookups use an HNSW index if the optional
+                              `hnswlib` package is installed
+
 High-level flow:
+    [embed_question] -> [SemanticCache.lookup] --hit--> cached dict (skip the rest)
+                         |
+                        miss
+                         v
     [retriever.search_guidelines] -> list of top-k snippets (with metadata)
                          |
                          v
@@ -38,19 +70,41 @@ High-level flow:
                          |
                          v
                     [llm_chat] -> call Ollama /api/chat (fallback /api/generate)
+                                  (async twin: llm_chat_async / answer_async)
+                                  (token streaming: llm_chat_stream / answer(on_token=...))
                          |
                          v
-                    dict(output, guideline_hits, drug, prompt)
+                    dict(output, guideline_hits, drug, prompt)  -> [SemanticCache.store]
 --------------------------------------------------------------------------------
 """
 
 from __future__ import annotations
 import os
-import json
+import re
 import time
+import atexit
+import random
+import string
+import asyncio
+import logging
 import argparse
+import threading
+import weakref
+from concurrent.futures import ThreadPoolExecutor
+import httpx
+import orjson
 import requests
-from typing import Any, Dict, List, Optional
+from requests.adapters import HTTPAdapter
+from urllib3.util.request import ACCEPT_ENCODING
+import numpy as np
+try:
+    import hnswlib  # optional: approximate-NN index for large semantic caches
+except ImportError:
+    hnswlib = None
+from collections import OrderedDict
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
 
 # We import the retriever module (your local search/DB access code),
 # and the pre-defined prompts to keep answers consistent & compliant.
@@ -66,14 +120,100 @@ from .prompt import SYSTEM, USER_TEMPLATE
 OLLAMA = os.getenv("OLLAMA_BASE_URL", "http://localhost:11434").rstrip("/")
 MODEL  = os.getenv("LLM_MODEL", "qwen2:7b-instruct")
 
-def _ollama_options() -> Dict[str, Any]:
+# One shared HTTP session for all Ollama calls: keeps TCP connections alive
+# between requests instead of paying a fresh handshake every time.
+# max_retries=0 because llm_chat runs its own retry loop.
+_SESSION = requests.Session()
+_ADAPTER = HTTPAdapter(pool_connections=10, pool_maxsize=10, max_retries=0)
+_SESSION.mount("http://", _ADAPTER)
+_SESSION.mount("https://", _ADAPTER)
+_SESSION.headers.update({
+    "Connection": "keep-alive",
+    # "gzip,deflate", plus br / zstd when urllib3 can decode them (brotli /
+    # zstandard installed); decompression is transparent, streaming included
+    "Accept-Encoding": ACCEPT_ENCODING,
+    "User-Agent": "CareMind-RAG/1.0",
+})
+atexit.register(_SESSION.close)
+
+# Request bodies are encoded with orjson (much faster than stdlib json on the
+# long, mostly-Chinese prompts) and sent as raw bytes with this header.
+# Always pass data=/content= bytes, never json=: some requests/httpx versions
+# encode json= with ensure_ascii=True, turning every Chinese character into a
+# 6-byte "\uXXXX" escape (2x the bytes of UTF-8 for the same prompt).
+_JSON_HEADERS = {"Content-Type": "application/json; charset=utf-8"}
+
+# Async counterpart of _SESSION (HTTP/2 needs the "h2" extra: pip install "httpx[http2]").
+# An AsyncClient belongs to the event loop it was first used on, so there is
+# one client per loop, created lazily: several asyncio.run() calls in
+# different threads (answer_batch, a server worker) each get their own and
+# never touch another loop's client. A client is only ever closed by its own
+# loop: aclose_async_client(), or automatically when the loop shuts down (see
+# _close_with_loop); if you run the loop yourself, await aclose_async_client()
+# before closing it.
+_ACLIENTS: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, Tuple[httpx.AsyncClient, Any, Any]]" = \
+    weakref.WeakKeyDictionary()
+_ACLIENTS_LOCK = threading.Lock()
+
+async def _close_with_loop(loop: asyncio.AbstractEventLoop, client: httpx.AsyncClient):
+    """
+    Parked at its `yield` for the life of the loop. asyncio.run() finalizes
+    every unfinished async generator (loop.shutdown_asyncgens) before closing
+    the loop, which runs the `finally` below while sockets can still be closed.
+    """
+    try:
+        yield
+    finally:
+        with _ACLIENTS_LOCK:
+            if _ACLIENTS.get(loop, (None,))[0] is client:
+                del _ACLIENTS[loop]
+        if not client.is_closed:
+            await client.aclose()
+
+def _aclient() -> httpx.AsyncClient:
+    """Return the shared AsyncClient of the currently running event loop."""
+    loop = asyncio.get_running_loop()
+    with _ACLIENTS_LOCK:
+        entry = _ACLIENTS.get(loop)
+        if entry is not None and not entry[0].is_closed:
+            return entry[0]
+        client = httpx.AsyncClient(
+            http2=True,
+            timeout=httpx.Timeout(120.0, connect=10.0),
+            limits=httpx.Limits(max_keepalive_connections=40,
+                                max_connections=100,
+                                keepalive_expiry=30.0),
+            headers={"User-Agent": "CareMind-RAG/1.0"},
+        )
+        guard = _close_with_loop(loop, client)
+        started = asyncio.ensure_future(guard.__anext__())  # start it so the loop tracks it
+        _ACLIENTS[loop] = (client, guard, started)
+    return client
+
+async def aclose_async_client() -> None:
+    """Close the running loop's AsyncClient (call before your event loop shuts down)."""
+    with _ACLIENTS_LOCK:
+        entry = _ACLIENTS.get(asyncio.get_running_loop())
+    if entry is not None:
+        _, guard, started = entry
+        await started             # the guard must be parked at its yield ...
+        await guard.aclose()      # ... so that this runs its finally: forget + close
+
+_DEFAULT_NUM_CTX = 16384
+
+def _build_ollama_options() -> Dict[str, Any]:
     """
     Read optional decoding parameters from environment variables.
     These are passed to Ollama under "options".
+    Called once at import (see _OLLAMA_OPTIONS): restart the process after
+    changing LLM_* env vars.
     Beginners:
       - temperature: lower (e.g., 0.1) = more deterministic, safer for medical QA
       - top_p: nucleus sampling; often keep default if unsure
-      - num_ctx: context window size (tokens); bigger lets you pass more text
+      - num_ctx: context window size (tokens); bigger lets you pass more text.
+        Always sent (default _DEFAULT_NUM_CTX): the prompt budget below is
+        computed from it, and Ollama's own default (2048/4096) would silently
+        cut the prompt from the front, system prompt first.
     """
     def _f(name: str) -> Optional[float]:
         v = os.getenv(name)
@@ -96,7 +236,7 @@ def _ollama_options() -> Dict[str, Any]:
     if t  is not None: opts["temperature"] = t
     if tp is not None: opts["top_p"]       = tp
     if sd is not None: opts["seed"]        = sd
-    if nc is not None: opts["num_ctx"]     = nc
+    opts["num_ctx"] = nc if nc is not None else _DEFAULT_NUM_CTX
 
     # Safe default: keep generation stable for clinical style answers
     if "temperature" not in opts:
@@ -104,7 +244,104 @@ def _ollama_options() -> Dict[str, Any]:
 
     return opts
 
-def llm_chat(system: str, user: str, timeout: int = 120, retries: int = 2) -> str:
+# Decoding options, parsed once. Treat as read-only; per-call overrides go
+# through the `extra_options` argument of llm_chat / llm_chat_async.
+_OLLAMA_OPTIONS: Dict[str, Any] = _build_ollama_options()
+
+def _options_for(extra_options: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Shared options, or a merged copy only when the caller overrides something."""
+    return {**_OLLAMA_OPTIONS, **extra_options} if extra_options else _OLLAMA_OPTIONS
+
+# How long Ollama keeps the model in memory after each request (its own default
+# is 5 minutes). Sent with every call, including the warm-up below.
+_KEEP_ALIVE = "30m"
+
+def _chat_payload(system: str, user: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Payload for /api/chat (messages with roles)."""
+    return {
+        "model": MODEL,
+        "messages": [
+            {"role": "system", "content": system},
+            {"role": "user",   "content": user},
+        ],
+        "stream": False,        # we want a single JSON response
+        "options": options,     # pass decoding options
+        "keep_alive": _KEEP_ALIVE,
+    }
+
+def _generate_payload(system: str, user: str, options: Dict[str, Any]) -> Dict[str, Any]:
+    """Payload for /api/generate (older Ollama uses "prompt" instead of messages)."""
+    # We concatenate system + user in a readable way
+    prompt = (
+        "【系统角色】\n" + system.strip() +
+        "\n\n【用户】\n" + user.strip() +
+        "\n\n请严格按照系统角色与合规要求作答。"
+    )
+    return {
+        "model": MODEL,
+        "prompt": prompt,
+        "stream": False,
+        "options": options,
+        "keep_alive": _KEEP_ALIVE,
+    }
+
+class _EmptyContent(ValueError):
+    """The server answered 200 but with no text (worth exactly one more try)."""
+
+def _chat_content(data: Dict[str, Any]) -> str:
+    """Standard /api/chat shape: {"message": {"content": "..."}}."""
+    content = (data.get("message") or {}).get("content", "")
+    if not isinstance(content, str) or not content.strip():
+        raise _EmptyContent("Empty content from /api/chat")
+    return content
+
+def _generate_content(data: Dict[str, Any]) -> str:
+    """Standard /api/generate shape: {"response": "..."}."""
+    content = data.get("response", "")
+    if not isinstance(content, str) or not content.strip():
+        raise _EmptyContent("Empty content from /api/generate")
+    return content
+
+# -----------------------------------------------------------------------------
+# Retry policy shared by llm_chat / llm_chat_stream / llm_chat_async.
+#   retry:      connection errors, timeouts, HTTP 5xx (server busy / crashed)
+#   retry once: 200 with empty content
+#   fail fast:  HTTP 4xx (bad model name, bad payload...), malformed JSON
+# Waits grow exponentially with a little random jitter, so many clients
+# sharing one Ollama server don't all come back at the same instant.
+# -----------------------------------------------------------------------------
+_TRANSIENT_ERRORS = (
+    requests.ConnectionError, requests.Timeout,
+    requests.exceptions.ChunkedEncodingError,
+    httpx.TransportError,
+)
+
+def _is_transient(e: Exception) -> bool:
+    """Connection problem, timeout or 5xx: the same request may succeed later."""
+    if isinstance(e, _TRANSIENT_ERRORS):
+        return True
+    if isinstance(e, (requests.HTTPError, httpx.HTTPStatusError)):
+        resp = e.response
+        return resp is not None and resp.status_code >= 500
+    return False
+
+def _retry_delay(e: Exception, attempt: int, retries: int,
+                 empty_retried: bool) -> Optional[float]:
+    """Seconds to wait before the next attempt, or None to give up now."""
+    if attempt >= retries:
+        return None
+    if isinstance(e, _EmptyContent):
+        if empty_retried:
+            return None
+    elif not _is_transient(e):
+        return None
+    return min(8.0, 0.25 * (2 ** attempt)) + random.uniform(0, 0.25)
+
+def _give_up(e: Exception, attempts: int) -> RuntimeError:
+    return RuntimeError(f"Ollama request failed after {attempts} attempt(s): {e}")
+
+def llm_chat(system: str, user: str, timeout: int = 120, retries: int = 2,
+             extra_options: Optional[Dict[str, Any]] = None) -> str:
     """
     Call the local LLM through Ollama.
     - We prefer the newer /api/chat endpoint (role-based messages).
@@ -117,153 +354,383 @@ def llm_chat(system: str, user: str, timeout: int = 120, retries: int = 2) -> st
       system: system prompt that sets role & rules (e.g., compliance)
       user:   user message composed from the question + retrieved evidence
       timeout: HTTP timeout seconds
-      retries: simple retry count for transient network hiccups
+      retries: extra attempts for transient failures (connection errors,
+               timeouts, 5xx); 4xx errors fail immediately
+      extra_options: optional per-call overrides of the decoding options
+                     (e.g. {"temperature": 0}); merged over the env defaults
 
     Returns:
       The assistant's text content (string), or raises RuntimeError on failure.
+
+    With temperature 0 (LLM_TEMPERATURE=0) the model is deterministic, so an
+    exact repeat of (system, user, options) is answered from a small in-memory
+    LRU cache without calling Ollama (see _chat_cache_key).
     """
-    options = _ollama_options()
+    options = _options_for(extra_options)
+    key = _chat_cache_key(system, user, options)
+    cached = _chat_cache_get(key)
+    if cached is not None:
+        return cached
+    text = _llm_chat_once(system, user, options, timeout, retries)
+    _chat_cache_put(key, text)
+    return text
 
-    # Payload for /api/chat (messages with roles)
-    chat_payload = {
-        "model": MODEL,
-        "messages": [
-            {"role": "system", "content": system},
-            {"role": "user",   "content": user},
-        ],
-        "stream": False,        # we want a single JSON response
-        "options": options,     # pass decoding options
-    }
+# Exact-string cache layer (the semantic cache sits on top of it in answer()),
+# shared by llm_chat, llm_chat_stream and llm_chat_async. Only used when
+# decoding is deterministic: with temperature > 0 a cached answer would freeze
+# one random sample. Failures are never cached.
+_CHAT_CACHE_SIZE = 256
+_CHAT_CACHE: "OrderedDict[Tuple[str, str, bytes], str]" = OrderedDict()
+_CHAT_CACHE_LOCK = threading.Lock()
 
-    last_err: Optional[Exception] = None
+def _chat_cache_key(system: str, user: str,
+                    options: Dict[str, Any]) -> Optional[Tuple[str, str, bytes]]:
+    """Cache key for one call, or None when its options are not deterministic."""
+    if options.get("temperature") != 0:
+        return None
+    # Options are part of the key because they shape the output
+    return system, user, orjson.dumps(options, option=orjson.OPT_SORT_KEYS)
+
+def _chat_cache_get(key: Optional[Tuple[str, str, bytes]]) -> Optional[str]:
+    if key is None:
+        return None
+    with _CHAT_CACHE_LOCK:
+        text = _CHAT_CACHE.get(key)
+        if text is not None:
+            _CHAT_CACHE.move_to_end(key)
+        return text
+
+def _chat_cache_put(key: Optional[Tuple[str, str, bytes]], text: str) -> None:
+    if key is None:
+        return
+    with _CHAT_CACHE_LOCK:
+        _CHAT_CACHE[key] = text
+        _CHAT_CACHE.move_to_end(key)
+        while len(_CHAT_CACHE) > _CHAT_CACHE_SIZE:
+            _CHAT_CACHE.popitem(last=False)
+
+def _llm_chat_once(system: str, user: str, options: Dict[str, Any],
+                   timeout: int = 120, retries: int = 2) -> str:
+    """The actual HTTP call behind llm_chat (retry loop + /api/generate fallback)."""
+    chat_body = orjson.dumps(_chat_payload(system, user, options))
+
+    empty_retried = False
     for attempt in range(retries + 1):
         try:
             # Try the modern endpoint first
-            r = requests.post(f"{OLLAMA}/api/chat", json=chat_payload, timeout=timeout)
+            r = _SESSION.post(f"{OLLAMA}/api/chat", data=chat_body,
+                              headers=_JSON_HEADERS, timeout=timeout)
             if r.status_code in (404, 405):
-                # Not supported on this server; trigger fallback
-                raise requests.HTTPError(f"{r.status_code} Not supported", response=r)
+                # Not supported on this server: fallback to /api/generate
+                g = _SESSION.post(f"{OLLAMA}/api/generate",
+                                  data=orjson.dumps(_generate_payload(system, user, options)),
+                                  headers=_JSON_HEADERS, timeout=timeout)
+                g.raise_for_status()
+                return _generate_content(orjson.loads(g.content))
 
             r.raise_for_status()
-            data = r.json()
-            # Standard shape: {"message": {"content": "..."}}
-            content = (data.get("message") or {}).get("content", "")
-            if not isinstance(content, str) or not content.strip():
-                raise ValueError("Empty content from /api/chat")
-            return content
+            return _chat_content(orjson.loads(r.content))
 
         except (requests.RequestException, ValueError, KeyError) as e:
-            last_err = e
-
-            # Fallback to /api/generate (older Ollama uses "prompt" instead of messages)
-            if isinstance(e, requests.HTTPError) and getattr(e, "response", None) \
-               and e.response is not None and e.response.status_code in (404, 405):
-                try:
-                    # We concatenate system + user in a readable way
-                    prompt = (
-                        "【系统角色】\n" + system.strip() +
-                        "\n\n【用户】\n" + user.strip() +
-                        "\n\n请严格按照系统角色与合规要求作答。"
-                    )
-                    gen_payload = {
-                        "model": MODEL,
-                        "prompt": prompt,
-                        "stream": False,
-                        "options": options,
-                    }
-                    g = requests.post(f"{OLLAMA}/api/generate", json=gen_payload, timeout=timeout)
-                    g.raise_for_status()
-                    data = g.json()
-                    content = data.get("response", "")
-                    if not isinstance(content, str) or not content.strip():
-                        raise ValueError("Empty content from /api/generate")
-                    return content
-                except Exception as ee:
-                    # If fallback also fails, save the error for the final raise
-                    last_err = ee
-
-            # Simple exponential-ish backoff between attempts
-            if attempt < retries:
-                time.sleep(1.0 * (attempt + 1))
-                continue
+            delay = _retry_delay(e, attempt, retries, empty_retried)
+            if delay is None:
+                raise _give_up(e, attempt + 1) from e
+            empty_retried = empty_retried or isinstance(e, _EmptyContent)
+            time.sleep(delay)
 
-            # Give up after retry budget
-            raise RuntimeError(
-                f"Ollama request failed after {retries+1} attempts: {last_err}"
-            ) from last_err
+def _chat_delta(data: Dict[str, Any]) -> str:
+    """Text piece of one /api/chat stream line."""
+    return (data.get("message") or {}).get("content", "") or ""
+
+def _generate_delta(data: Dict[str, Any]) -> str:
+    """Text piece of one /api/generate stream line."""
+    return data.get("response", "") or ""
+
+def _read_stream(resp: requests.Response, pick: Callable[[Dict[str, Any]], str],
+                 on_token: Callable[[str], None]) -> str:
+    """
+    Consume an Ollama NDJSON stream (one JSON object per line), pass every
+    text piece to on_token as it arrives, and return the full text.
+    """
+    parts: List[str] = []
+    for line in resp.iter_lines():
+        if not line:
+            continue
+        data = orjson.loads(line)
+        if data.get("error"):
+            raise ValueError(f"Ollama stream error: {data['error']}")
+        delta = pick(data)
+        if delta:
+            parts.append(delta)
+            on_token(delta)
+        if data.get("done"):
+            break
+    full = "".join(parts)
+    if not full.strip():
+        raise _EmptyContent("Empty content from stream")
+    return full
+
+def llm_chat_stream(system: str, user: str, on_token: Callable[[str], None],
+                    timeout: int = 120, retries: int = 2,
+                    extra_options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Like llm_chat, but with "stream": True: Ollama sends the answer piece by
+    piece, and on_token(piece) is called for each one as soon as it arrives
+    (e.g. print(piece, end="", flush=True)). The first words show up after a
+    few hundred ms instead of after the whole answer is generated.
+
+    Returns the full text, same as llm_chat. Retries only happen while nothing
+    has been passed to on_token yet, so a caller never sees text twice.
+    An exact-cache hit (temperature 0) is passed to on_token in one piece.
+    """
+    options = _options_for(extra_options)
+    key = _chat_cache_key(system, user, options)
+    cached = _chat_cache_get(key)
+    if cached is not None:
+        on_token(cached)
+        return cached
+    text = _llm_chat_stream_once(system, user, on_token, options, timeout, retries)
+    _chat_cache_put(key, text)
+    return text
+
+def _llm_chat_stream_once(system: str, user: str, on_token: Callable[[str], None],
+                          options: Dict[str, Any], timeout: int = 120,
+                          retries: int = 2) -> str:
+    """The actual streaming HTTP call behind llm_chat_stream."""
+    chat_body = orjson.dumps({**_chat_payload(system, user, options), "stream": True})
+
+    started = False
+    def _emit(tok: str) -> None:
+        nonlocal started
+        started = True
+        on_token(tok)
+
+    empty_retried = False
+    for attempt in range(retries + 1):
+        try:
+            with _SESSION.post(f"{OLLAMA}/api/chat", data=chat_body, headers=_JSON_HEADERS,
+                               timeout=timeout, stream=True) as r:
+                if r.status_code in (404, 405):
+                    # Older server: stream from /api/generate instead
+                    gen_body = orjson.dumps({**_generate_payload(system, user, options), "stream": True})
+                    with _SESSION.post(f"{OLLAMA}/api/generate", data=gen_body, headers=_JSON_HEADERS,
+                                       timeout=timeout, stream=True) as g:
+                        g.raise_for_status()
+                        return _read_stream(g, _generate_delta, _emit)
+                r.raise_for_status()
+                return _read_stream(r, _chat_delta, _emit)
+
+        except (requests.RequestException, ValueError, KeyError) as e:
+            delay = None if started else _retry_delay(e, attempt, retries, empty_retried)
+            if delay is None:
+                raise _give_up(e, attempt + 1) from e
+            empty_retried = empty_retried or isinstance(e, _EmptyContent)
+            time.sleep(delay)
+
+async def llm_chat_async(system: str, user: str, timeout: float = 120,
+                         retries: int = 2,
+                         extra_options: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Async version of llm_chat: same endpoints, same /api/generate fallback,
+    same retry policy — but it awaits instead of blocking, so several
+    questions can be sent at once with asyncio.gather(...).
+
+    How many of those the model really runs in parallel is decided by the
+    Ollama server (OLLAMA_NUM_PARALLEL); extra requests wait in its queue.
+    Shares the exact-string cache with llm_chat.
+    """
+    options = _options_for(extra_options)
+    key = _chat_cache_key(system, user, options)
+    cached = _chat_cache_get(key)
+    if cached is not None:
+        return cached
+    text = await _llm_chat_async_once(system, user, options, timeout, retries)
+    _chat_cache_put(key, text)
+    return text
+
+async def _llm_chat_async_once(system: str, user: str, options: Dict[str, Any],
+                               timeout: float = 120, retries: int = 2) -> str:
+    """The actual HTTP call behind llm_chat_async."""
+    chat_body = orjson.dumps(_chat_payload(system, user, options))
+    client = _aclient()
+
+    empty_retried = False
+    for attempt in range(retries + 1):
+        try:
+            r = await client.post(f"{OLLAMA}/api/chat", content=chat_body,
+                                  headers=_JSON_HEADERS, timeout=timeout)
+            if r.status_code in (404, 405):
+                # Older server: go straight to /api/generate
+                g = await client.post(f"{OLLAMA}/api/generate",
+                                      content=orjson.dumps(_generate_payload(system, user, options)),
+                                      headers=_JSON_HEADERS, timeout=timeout)
+                g.raise_for_status()
+                return _generate_content(orjson.loads(g.content))
+
+            r.raise_for_status()
+            return _chat_content(orjson.loads(r.content))
+
+        except (httpx.HTTPError, ValueError, KeyError) as e:
+            delay = _retry_delay(e, attempt, retries, empty_retried)
+            if delay is None:
+                raise _give_up(e, attempt + 1) from e
+            empty_retried = empty_retried or isinstance(e, _EmptyContent)
+            await asyncio.sleep(delay)
 
 # =============================================================================
-#                   Formatting helpers (make snippets readable)
+#                 Warm-up (load the model before the first question)
 # =============================================================================
 
-def format_guideline_snippets(hits: List[Dict[str, Any]]) -> str:
-    """
-    Turn guideline hits into a displayable block.
-    - We try hard to populate "来源(source)" and "年份(year)" even if the
-      original metadata is messy, using common alternatives like journal_name
-      or the filename stem.
-    - We also de-duplicate similar entries lightly (title, source, year, page).
+# Content-Encoding of the warm-up reply (None until a warm-up succeeded), i.e.
+# whether Ollama actually compresses; shown by GET /health and --verbose.
+_CONTENT_ENCODING: Optional[str] = None
 
-    Beginners: a "hit" here is a dict like:
-      {
-        "content": "...a snippet of text...",
-        "meta": {"title": "...", "source": "...", "year": "...", ...},
-        "score": 0.87,
-        ...
-      }
+def _log_content_encoding() -> None:
+    if _CONTENT_ENCODING is not None:
+        logger.info("Ollama warm-up ok: model=%s, Accept-Encoding=%s, Content-Encoding=%s",
+                    MODEL, ACCEPT_ENCODING, _CONTENT_ENCODING)
+
+def warmup(timeout: float = 30) -> bool:
     """
-    import os, re
+    Make the first real question fast:
+      1) GET /api/tags opens the keep-alive connection (and checks the server is up),
+      2) a 1-token /api/generate makes Ollama load the model weights into memory
+         (several seconds for a 7B model) and keep them there for _KEEP_ALIVE.
+    Never raises; returns True if the model answered.
+    """
+    global _CONTENT_ENCODING
+    try:
+        _SESSION.get(f"{OLLAMA}/api/tags", timeout=timeout).raise_for_status()
+        body = orjson.dumps({
+            "model": MODEL,
+            "prompt": " ",
+            "stream": False,
+            "keep_alive": _KEEP_ALIVE,
+            # Same num_ctx as real calls, or Ollama reloads the model on the first question
+            "options": {"num_ctx": _OLLAMA_OPTIONS["num_ctx"], "num_predict": 1},
+        })
+        r = _SESSION.post(f"{OLLAMA}/api/generate", data=body,
+                          headers=_JSON_HEADERS, timeout=timeout)
+        r.raise_for_status()
+        # Once per process: shows whether the server actually compresses replies
+        _CONTENT_ENCODING = r.headers.get("Content-Encoding") or "identity"
+        _log_content_encoding()
+        return True
+    except Exception as e:
+        logger.info("Ollama warm-up skipped: %s", e)
+        return False
 
-    def _first(*vals):
-        """Return the first non-empty string from vals."""
-        for v in vals:
-            if v is not None and str(v).strip():
-                return str(v).strip()
-        return None
+_WARMUP_THREAD: Optional[threading.Thread] = None
 
-    def _stem(path):
-        """Get `filename` without extension from a path-like string."""
-        if not path: return None
-        base = os.path.basename(str(path))
-        return re.sub(r'\.[^.]+$', '', base)
+def start_warmup() -> threading.Thread:
+    """Run warmup() once in a background daemon thread (later calls reuse it)."""
+    global _WARMUP_THREAD
+    if _WARMUP_THREAD is None:
+        _WARMUP_THREAD = threading.Thread(target=warmup, name="caremind-warmup", daemon=True)
+        _WARMUP_THREAD.start()
+    return _WARMUP_THREAD
 
-    def _infer_source(meta):
-        """
-        Try different keys to infer a readable "来源".
-        If all else fails, we fall back to filename or title.
-        """
-        return _first(
-            meta.get("source"),
-            meta.get("org"), meta.get("organization"), meta.get("issuer"),
-            meta.get("journal_name"), meta.get("journal"), meta.get("publisher"),
-            meta.get("collection"), meta.get("website"), meta.get("book_title"),
-            meta.get("conference"),
-            _stem(meta.get("source_filename") or meta.get("file")),
-            meta.get("title"),
-        ) or "未知来源"
-
-    def _infer_year(meta):
-        """
-        Try to get a 4-digit year from year/date/title/filename.
-        If parsing fails, return "未知年份".
-        """
-        y = _first(meta.get("year"), meta.get("pub_year"),
-                   meta.get("publish_date"), meta.get("date"))
-        if y:
-            m = re.search(r'(19|20)\d{2}', str(y))
-            if m: return m.group(0)
-        for f in ("title", "source_filename", "file"):
-            s = meta.get(f)
+if os.getenv("CAREMIND_WARMUP", "1") == "1":
+    start_warmup()
+
+# =============================================================================
+#                   Formatting helpers (make snippets readable)
+# =============================================================================
+
+# -----------------------------------------------------------------------------
+# Token budget. Chinese text costs ~1 token per character, English ~1 token per
+# 4 characters, so a fixed character cut either overflows num_ctx (Chinese) or
+# wastes it (English). We estimate tokens with that rule of thumb instead of
+# loading a tokenizer; it is close enough for Qwen2 on mixed guideline text.
+# -----------------------------------------------------------------------------
+_CJK_RE = re.compile(r'[\u3000-\u303f\u3400-\u4dbf\u4e00-\u9fff\uf900-\ufaff\uff00-\uffef]')
+
+def _estimate_tokens(text: str) -> int:
+    """Rough token count: 1 per CJK character/punctuation, 1 per 4 other characters."""
+    cjk = len(_CJK_RE.findall(text))
+    return cjk + (len(text) - cjk + 3) // 4
+
+def _truncate_to_tokens(text: str, max_tokens: int) -> str:
+    """Cut text so that _estimate_tokens(result) <= max_tokens."""
+    if _estimate_tokens(text) <= max_tokens:
+        return text
+    budget = max_tokens * 4          # work in quarter-tokens
+    for i, ch in enumerate(text):
+        budget -= 4 if _CJK_RE.match(ch) else 1
+        if budget < 0:
+            return text[:i]
+    return text
+
+_NUM_CTX        = int(_OLLAMA_OPTIONS["num_ctx"])  # same window Ollama is told to use
+_SYS_TOK        = _estimate_tokens(SYSTEM)
+_RESERVED_TOK   = 512                # room for the template text and the answer
+_SNIPPET_TOKENS: Optional[int] = (int(os.environ["CAREMIND_SNIPPET_TOKENS"])
+                                   if os.getenv("CAREMIND_SNIPPET_TOKENS") else None)
+_DEFAULT_SNIPPET_TOKENS = 1200       # no budget given: same as the old 1200-char cut for Chinese
+_MIN_SNIPPET_TOKENS = 64             # never cut a snippet below this
+
+_EXT_RE  = re.compile(r'\.[^.]+$')
+_YEAR_RE = re.compile(r'(19|20)\d{2}')
+
+def _first(*vals):
+    """Return the first non-empty string from vals."""
+    for v in vals:
+        if v is not None and str(v).strip():
+            return str(v).strip()
+    return None
+
+def _stem(path):
+    """Get `filename` without extension from a path-like string."""
+    if not path: return None
+    base = os.path.basename(str(path))
+    return _EXT_RE.sub('', base)
+
+# Metadata keys tried in order; the first non-empty value wins.
+_SOURCE_KEYS = ("source", "org", "organization", "issuer",
+                "journal_name", "journal", "publisher",
+                "collection", "website", "book_title", "conference")
+_YEAR_KEYS   = ("year", "pub_year", "publish_date", "date")
+_YEAR_TEXT_KEYS = ("title", "source_filename", "file")
+
+def _first_key(meta, keys):
+    """Like _first over meta[key] for keys, but stops at the first usable one."""
+    for k in keys:
+        v = meta.get(k)
+        if v is not None:
+            s = str(v).strip()
             if s:
-                m = re.search(r'(19|20)\d{2}', str(s))
-                if m: return m.group(0)
-        return "未知年份"
+                return s
+    return None
 
-    if not hits:
-        return "未检索到相关指南片段。"
+def _infer_source(meta):
+    """
+    Try different keys to infer a readable "来源".
+    If all else fails, we fall back to filename or title.
+    """
+    return (_first_key(meta, _SOURCE_KEYS)
+            or _first(_stem(meta.get("source_filename") or meta.get("file")))
+            or _first_key(meta, ("title",))
+            or "未知来源")
 
+def _infer_year(meta):
+    """
+    Try to get a 4-digit year from year/date/title/filename.
+    If parsing fails, return "未知年份".
+    """
+    y = _first_key(meta, _YEAR_KEYS)
+    if y:
+        m = _YEAR_RE.search(y)
+        if m: return m.group(0)
+    for f in _YEAR_TEXT_KEYS:
+        s = meta.get(f)
+        if s:
+            m = _YEAR_RE.search(str(s))
+            if m: return m.group(0)
+    return "未知年份"
+
+def _snippet_blocks(hits: List[Dict[str, Any]], per_hit_tokens: int):
+    """Yield one "【标题 | 来源 | 年份】\n片段" block per distinct hit."""
     seen = set()
-    lines: List[str] = []
     for h in hits:
         meta = h.get("meta") or {}
         src   = _infer_source(meta)
@@ -276,11 +743,50 @@ def format_guideline_snippets(hits: List[Dict[str, Any]]) -> str:
         seen.add(key)
 
         # Trim content to keep prompts short (LLM context is precious)
-        content = (h.get("content") or "").strip()[:1200]
-        title_s = f"{title} | " if title else ""
-        lines.append(f"【{title_s}{src} | {year}】\n{content}")
+        content = _truncate_to_tokens((h.get("content") or "").strip(), per_hit_tokens)
+        yield f"【{title} | {src} | {year}】\n{content}" if title else f"【{src} | {year}】\n{content}"
 
-    return "\n\n".join(lines)
+def format_guideline_snippets(hits: List[Dict[str, Any]],
+                              budget_tokens: Optional[int] = None) -> str:
+    """
+    Turn guideline hits into a displayable block.
+    - We try hard to populate "来源(source)" and "年份(year)" even if the
+      original metadata is messy, using common alternatives like journal_name
+      or the filename stem.
+    - We also de-duplicate similar entries lightly (title, source, year, page).
+    - With budget_tokens (what is left of num_ctx), each hit gets an equal
+      share of it, so the whole block fits the model's context window.
+      Without it, each snippet keeps up to 1200 (estimated) tokens.
+      CAREMIND_SNIPPET_TOKENS, if set, caps every snippet on top of that.
+
+    Beginners: a "hit" here is a dict like:
+      {
+        "content": "...a snippet of text...",
+        "meta": {"title": "...", "source": "...", "year": "...", ...},
+        "score": 0.87,
+        ...
+      }
+    """
+    if not hits:
+        return "未检索到相关指南片段。"
+    if budget_tokens is not None:
+        per_hit = max(_MIN_SNIPPET_TOKENS, budget_tokens // len(hits))
+    else:
+        per_hit = _DEFAULT_SNIPPET_TOKENS
+    if _SNIPPET_TOKENS is not None:
+        per_hit = min(per_hit, _SNIPPET_TOKENS)
+    return "\n\n".join(_snippet_blocks(hits, per_hit))
+
+# Drug fields we render, in display order: (record key, Chinese label)
+_DRUG_FIELDS: Tuple[Tuple[str, str], ...] = (
+    ("name", "药品名称"),
+    ("indications", "适应症"),
+    ("contraindications", "禁忌症"),
+    ("interactions", "药物相互作用"),
+    ("dosage", "用法用量"),
+    ("pregnancy_category", "妊娠分级"),
+    ("source", "来源"),
+)
 
 def format_drug_info(drug: Optional[Dict[str, Any]]) -> str:
     """
@@ -294,22 +800,202 @@ def format_drug_info(drug: Optional[Dict[str, Any]]) -> str:
     if not drug:
         return "未指定药品"
 
-    keys = [
-        ("name", "药品名称"),
-        ("indications", "适应症"),
-        ("contraindications", "禁忌症"),
-        ("interactions", "药物相互作用"),
-        ("dosage", "用法用量"),
-        ("pregnancy_category", "妊娠分级"),
-        ("source", "来源"),
-    ]
-    lines = []
-    for k, label in keys:
-        v = drug.get(k)
-        if v:
-            lines.append(f"{label}: {v}")
-
-    return "\n".join(lines) if lines else "（药品信息存在，但字段为空）"
+    text = "\n".join(f"{label}: {v}" for k, label in _DRUG_FIELDS if (v := drug.get(k)))
+    return text or "（药品信息存在，但字段为空）"
+
+def embed_question(question: str) -> List[float]:
+    """
+    Embed a question with the retriever's embedding model (the same one used
+    for guideline search, so it is already loaded). Vectors are L2-normalized,
+    which means a plain dot product between two of them is cosine similarity.
+    Used by callers that want to cache answers for near-duplicate questions.
+    """
+    return R.embed_text(question.strip())
+
+def embed_questions(questions: List[str]) -> List[List[float]]:
+    """Batch version of embed_question: one encoder pass for all questions."""
+    return R.embed_texts([q.strip() for q in questions])
+
+# =============================================================================
+#                Semantic cache (near-duplicate questions -> answer)
+# =============================================================================
+
+class SemanticCache:
+    """
+    A small in-process cache that maps *question embeddings* to answer dicts.
+
+    Clinical users often ask the same thing in slightly different words.
+    Exact-string caching misses those; here we compare the new question's
+    embedding against stored ones and reuse the stored answer when the cosine
+    similarity is at least `threshold`.
+
+    Design:
+      - embeddings are L2-normalized, so cosine similarity is a dot product;
+        all vectors live in one contiguous (max_entries, d) float32 matrix and
+        a lookup is a single `matrix @ query`
+      - each entry has a namespace (here: (drug_name, k)) and only entries of
+        the same namespace can match, so answers never leak across drugs
+      - entries expire after `ttl` seconds (<= 0 means never); when full, an
+        expired slot is reused first, otherwise the least recently used one
+      - a lock makes lookup/store safe to call from several threads
+      - past HNSW_MIN_ENTRIES entries (and if `hnswlib` is installed) lookups
+        ask an HNSW graph index for the nearest HNSW_CANDIDATES slots instead
+        of scanning the whole matrix; labels in the index are slot numbers, so
+        overwriting a slot just updates its vector in the index
+    """
+
+    HNSW_MIN_ENTRIES = 1024
+    HNSW_CANDIDATES = 16
+
+    def __init__(self, threshold: float = 0.92, ttl: float = 300.0, max_entries: int = 4096):
+        self.threshold = threshold
+        self.ttl = ttl if ttl > 0 else float("inf")
+        self.max_entries = max(1, int(max_entries))
+        self._vecs: Optional[np.ndarray] = None   # (max_entries, d), allocated on first store
+        self._spaces: List[Any] = []              # namespace per slot
+        self._values: List[Dict[str, Any]] = []   # cached answer per slot
+        self._stored = np.zeros(self.max_entries)  # store time per slot (monotonic)
+        self._used = np.zeros(self.max_entries)    # last hit/store time per slot (LRU)
+        self._hnsw: Any = None                      # hnswlib.Index, built lazily
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._values)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._vecs = None
+            self._hnsw = None
+            self._spaces.clear()
+            self._values.clear()
+
+    def reserve(self, dim: int) -> None:
+        """Allocate the (max_entries, dim) matrix now instead of on the first store."""
+        with self._lock:
+            if self._vecs is None or self._vecs.shape[1] != dim:
+                self._vecs = np.zeros((self.max_entries, dim), dtype=np.float32)
+                self._hnsw = None
+                self._spaces.clear()
+                self._values.clear()
+
+    def _index(self) -> Any:
+        """The HNSW index once the cache is big enough, else None (flat scan)."""
+        n = len(self._values)
+        if self._hnsw is None and hnswlib is not None and n > self.HNSW_MIN_ENTRIES:
+            index = hnswlib.Index(space="cosine", dim=self._vecs.shape[1])
+            index.init_index(max_elements=self.max_entries, ef_construction=200, M=16)
+            index.set_num_threads(1)
+            index.add_items(self._vecs[:n], np.arange(n))
+            index.set_ef(64)
+            self._hnsw = index
+        return self._hnsw
+
+    def _flat_best(self, Q: np.ndarray, namespaces: List[Any], now: float) -> List[Optional[int]]:
+        """Exact search: one (m, d) @ (d, n) product, then mask by namespace and TTL."""
+        n = len(self._values)
+        sims = Q @ self._vecs[:n].T                            # (m, n)
+        alive = (now - self._stored[:n]) <= self.ttl
+        masks: Dict[Any, np.ndarray] = {}
+        out: List[Optional[int]] = []
+        for j, ns in enumerate(namespaces):
+            mask = masks.get(ns)
+            if mask is None:
+                mask = np.fromiter((s == ns for s in self._spaces), dtype=bool, count=n) & alive
+                masks[ns] = mask
+            row = np.where(mask, sims[j], -np.inf)
+            i = int(np.argmax(row))
+            out.append(i if row[i] >= self.threshold else None)
+        return out
+
+    def _best(self, Q: np.ndarray, namespaces: List[Any], now: float) -> List[Optional[int]]:
+        """Per row of Q: slot of the most similar live same-namespace entry, or None."""
+        index = self._index()
+        if index is None:
+            return self._flat_best(Q, namespaces, now)
+        labels, dists = index.knn_query(Q, k=min(self.HNSW_CANDIDATES, len(self._values)))
+        out: List[Optional[int]] = []
+        for j, ns in enumerate(namespaces):
+            best: Optional[int] = None
+            for label, dist in zip(labels[j], dists[j]):
+                if 1.0 - dist < self.threshold:
+                    break                    # candidates are sorted: nothing closer is left
+                i = int(label)
+                if self._spaces[i] == ns and now - self._stored[i] <= self.ttl:
+                    best = i
+                    break
+            else:
+                # every candidate was similar enough but expired / another drug:
+                # rare, so fall back to the exact scan for this one question
+                best = self._flat_best(Q[j:j + 1], [ns], now)[0]
+            out.append(best)
+        return out
+
+    def lookup(self, emb: List[float], namespace: Any) -> Optional[Dict[str, Any]]:
+        """Return the cached answer for the most similar live question, or None."""
+        q = np.asarray(emb, dtype=np.float32)
+        with self._lock:
+            n = len(self._values)
+            if n == 0 or self._vecs is None or q.shape[0] != self._vecs.shape[1]:
+                return None
+            now = time.monotonic()
+            i = self._best(q[None, :], [namespace], now)[0]
+            if i is None:
+                return None
+            self._used[i] = now
+            return dict(self._values[i])
+
+    def lookup_many(self, embs: List[List[float]], namespaces: List[Any]) -> List[Optional[Dict[str, Any]]]:
+        """
+        lookup() for many questions at once: all similarities come from one
+        (m, d) @ (d, n) matrix product (or one batched HNSW query) instead of
+        m separate ones.
+        """
+        out: List[Optional[Dict[str, Any]]] = [None] * len(namespaces)
+        Q = np.asarray(embs, dtype=np.float32)
+        with self._lock:
+            n = len(self._values)
+            if (n == 0 or self._vecs is None or Q.ndim != 2
+                    or Q.shape[1] != self._vecs.shape[1]):
+                return out
+            now = time.monotonic()
+            for j, i in enumerate(self._best(Q, namespaces, now)):
+                if i is not None:
+                    self._used[i] = now
+                    out[j] = dict(self._values[i])
+            return out
+
+    def store(self, emb: List[float], namespace: Any, value: Dict[str, Any]) -> None:
+        q = np.asarray(emb, dtype=np.float32)
+        with self._lock:
+            now = time.monotonic()
+            if self._vecs is None or q.shape[0] != self._vecs.shape[1]:
+                # first store (or the embedding model changed): start fresh
+                self._vecs = np.zeros((self.max_entries, q.shape[0]), dtype=np.float32)
+                self._hnsw = None
+                self._spaces.clear()
+                self._values.clear()
+            n = len(self._values)
+            if n < self.max_entries:
+                i = n
+                self._spaces.append(namespace)
+                self._values.append(value)
+            else:
+                expired = (now - self._stored) > self.ttl
+                i = int(np.argmax(expired)) if expired.any() else int(np.argmin(self._used))
+                self._spaces[i] = namespace
+                self._values[i] = value
+            self._vecs[i] = q
+            self._stored[i] = now
+            self._used[i] = now
+            if self._hnsw is not None:
+                self._hnsw.add_items(q[None, :], np.array([i]))   # same label = replace
+
+
+_SEM_CACHE = SemanticCache(
+    threshold=float(os.getenv("CAREMIND_CACHE_THRESHOLD", "0.92")),
+    ttl=float(os.getenv("CAREMIND_CACHE_TTL", "300")),
+    max_entries=int(os.getenv("CAREMIND_CACHE_SIZE", "4096")),
+)
 
 # =============================================================================
 #                    Compose prompt + call LLM (main routine)
@@ -342,9 +1028,86 @@ def _pick_drug_record(drug_name: Optional[str]) -> Optional[Dict[str, Any]]:
 
     return None
 
-def answer(question: str, drug_name: Optional[str] = None, k: int = 4) -> Dict[str, Any]:
+# Small worker pool so answer() can look up the drug record while the guideline
+# search runs (both are independent, I/O-bound DB lookups).
+_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="caremind-retrieve")
+
+# Opt-in: with no guideline hit and no drug record there is nothing to ground an
+# answer on, so we skip the (multi-second) generation and say so instead.
+_FAIL_FAST = os.getenv("CAREMIND_FAIL_FAST", "0") == "1"
+_NO_EVIDENCE_OUTPUT = "未检索到足够的临床指南与药品资料，建议补充检索或咨询医生。"
+
+def _no_evidence_result() -> Dict[str, Any]:
+    """Deterministic answer used by CAREMIND_FAIL_FAST (no LLM call, no prompt)."""
+    return {
+        "output": _NO_EVIDENCE_OUTPUT,
+        "guideline_hits": [],
+        "drug": None,
+        "prompt": {"system": SYSTEM, "user": ""},
+    }
+
+def _cache_scope(drug_name: Optional[str], k: int) -> Tuple[int, Tuple[Optional[str], int]]:
+    """Effective k and the semantic-cache namespace (same drug + same k)."""
+    k_eff = max(1, int(k)) if k else 4
+    return k_eff, ((drug_name or "").strip() or None, k_eff)
+
+def _embed_or_none(question: str) -> Optional[List[float]]:
+    """Embed the question for the cache; a failing encoder just disables caching."""
+    try:
+        return embed_question(question)
+    except Exception:
+        return None
+
+# USER_TEMPLATE lexed once: (literal_text, field_name, format_spec, conversion)
+# chunks, so rendering a prompt is a walk + join instead of a str.format re-parse.
+_USER_FORMATTER = string.Formatter()
+_USER_PARSED = list(_USER_FORMATTER.parse(USER_TEMPLATE))
+
+def _render_user(question: str, guideline_snippets: str, drug_info: str, k: int) -> str:
+    """Same result as USER_TEMPLATE.format(...), using the pre-parsed chunks."""
+    values = {
+        "question": question,
+        "guideline_snippets": guideline_snippets,
+        "drug_info": drug_info,
+        "k": k,
+    }
+    parts: List[str] = []
+    for literal, field, spec, conv in _USER_PARSED:
+        if literal:
+            parts.append(literal)
+        if field is None:
+            continue
+        value = values[field]
+        if conv:
+            value = _USER_FORMATTER.convert_field(value, conv)
+        parts.append(format(value, spec) if spec else str(value))
+    return "".join(parts)
+
+def _build_user(question: str, g_hits: List[Dict[str, Any]],
+                drug: Optional[Dict[str, Any]], k: int) -> str:
+    """
+    Render the user message via the template (keeps formatting consistent).
+    Guideline snippets get whatever is left of num_ctx after the system
+    prompt, the question, the drug block and a safety margin.
+    """
+    question = question.strip()
+    drug_info = format_drug_info(drug) if drug else "未指定药品"
+    budget = (_NUM_CTX - _SYS_TOK - _RESERVED_TOK
+              - _estimate_tokens(question) - _estimate_tokens(drug_info))
+    return _render_user(
+        question=question,
+        guideline_snippets=format_guideline_snippets(g_hits, budget_tokens=budget),
+        drug_info=drug_info,
+        k=k,
+    )
+
+def answer(question: str, drug_name: Optional[str] = None, k: int = 4,
+           use_cache: bool = True,
+           on_token: Optional[Callable[[str], None]] = None,
+           query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
     """
     The "do everything" function:
+      - (optional) reuse the answer of a near-duplicate earlier question
       - retrieve guideline snippets
       - retrieve (optional) drug info
       - build user prompt from template
@@ -355,6 +1118,13 @@ def answer(question: str, drug_name: Optional[str] = None, k: int = 4) -> Dict[s
       question: clinical question in Chinese (recommended)
       drug_name: optional drug name (Chinese/English both OK)
       k: number of top guideline snippets to include
+      use_cache: look up / store the answer in the semantic cache
+      on_token: optional callback; if given, the answer is streamed and each
+                text piece is passed to it as it arrives (a cached answer is
+                passed in one piece)
+      query_embedding: the question's embedding (embed_question) if the caller
+                       already computed it, e.g. for its own cache; skips
+                       encoding the question a second time
 
     Returns:
       A dict with:
@@ -363,31 +1133,174 @@ def answer(question: str, drug_name: Optional[str] = None, k: int = 4) -> Dict[s
         "drug": the structured drug record (or None),
         "prompt": {"system": SYSTEM, "user": the final rendered user prompt}
     """
-    # 1) Retrieve guideline snippets (top-k)
-    g_hits = R.search_guidelines(question, k=max(1, int(k)) if k else 4) or []
-    g_text = format_guideline_snippets(g_hits)
+    # 0) Semantic cache: same drug + same k + very similar question -> reuse.
+    #    The embedding is reused for guideline search, so a miss costs nothing extra.
+    k_eff, namespace = _cache_scope(drug_name, k)
+    q_emb = query_embedding
+    if use_cache:
+        if q_emb is None:
+            q_emb = _embed_or_none(question)
+        if q_emb is not None:
+            hit = _SEM_CACHE.lookup(q_emb, namespace)
+            if hit is not None:
+                if on_token is not None:
+                    on_token(hit["output"])
+                return hit
 
-    # 2) (Optional) drug info
-    drug = _pick_drug_record(drug_name)
-    d_text = format_drug_info(drug)
+    # 1) + 2) Guideline snippets (top-k) and (optional) drug info.
+    #    With a drug name, the drug lookup runs on _POOL while this thread
+    #    searches guidelines, so we wait max(search, lookup) instead of the sum.
+    fut_drug = _POOL.submit(_pick_drug_record, drug_name) if drug_name else None
+    g_hits = R.search_guidelines(question, k=k_eff, query_embedding=q_emb) or []
+    drug = fut_drug.result() if fut_drug is not None else None
 
-    # 3) Build user message via template (keeps formatting consistent)
-    user = USER_TEMPLATE.format(
-        question=question.strip(),
-        guideline_snippets=g_text,
-        drug_info=d_text,
-        k=k,
-    )
+    # 2b) Nothing retrieved at all: optionally answer without the LLM
+    if _FAIL_FAST and not g_hits and not drug:
+        res = _no_evidence_result()
+        if on_token is not None:
+            on_token(res["output"])
+        return res
 
-    # 4) Call LLM through Ollama
-    output = llm_chat(SYSTEM, user)
+    # 3) Build user message via template
+    user = _build_user(question, g_hits, drug, k)
 
-    return {
+    # 4) Call LLM through Ollama (streamed when the caller wants tokens live)
+    if on_token is not None:
+        output = llm_chat_stream(SYSTEM, user, on_token)
+    else:
+        output = llm_chat(SYSTEM, user)
+
+    result = {
+        "output": output,
+        "guideline_hits": g_hits,
+        "drug": drug,
+        "prompt": {"system": SYSTEM, "user": user},
+    }
+    if use_cache and q_emb is not None:
+        _SEM_CACHE.store(q_emb, namespace, result)
+    return result
+
+async def answer_async(question: str, drug_name: Optional[str] = None, k: int = 4,
+                       use_cache: bool = True,
+                       query_embedding: Optional[List[float]] = None) -> Dict[str, Any]:
+    """
+    Async version of answer() with the same arguments and return dict.
+
+    The retriever (embedding model + vector DB) is synchronous, so it runs in a
+    worker thread via asyncio.to_thread; the LLM call uses llm_chat_async.
+    Typical use:
+        results = await asyncio.gather(*(answer_async(q) for q in questions))
+
+    query_embedding: the question's embedding if the caller already has it
+    (answer_batch embeds all questions in one pass); skips re-encoding.
+    """
+    k_eff, namespace = _cache_scope(drug_name, k)
+    q_emb = query_embedding
+    if use_cache:
+        if q_emb is None:
+            q_emb = await asyncio.to_thread(_embed_or_none, question)
+        if q_emb is not None:
+            hit = _SEM_CACHE.lookup(q_emb, namespace)
+            if hit is not None:
+                return hit
+
+    search = asyncio.to_thread(R.search_guidelines, question, k=k_eff, query_embedding=q_emb)
+    if drug_name:
+        g_hits, drug = await asyncio.gather(
+            search, asyncio.to_thread(_pick_drug_record, drug_name)
+        )
+    else:
+        g_hits, drug = await search, None
+    g_hits = g_hits or []
+    if _FAIL_FAST and not g_hits and not drug:
+        return _no_evidence_result()
+    user = _build_user(question, g_hits, drug, k)
+
+    output = await llm_chat_async(SYSTEM, user)
+
+    result = {
         "output": output,
         "guideline_hits": g_hits,
         "drug": drug,
         "prompt": {"system": SYSTEM, "user": user},
     }
+    if use_cache and q_emb is not None:
+        _SEM_CACHE.store(q_emb, namespace, result)
+    return result
+
+async def _answer_batch_async(questions: List[str],
+                              drug_names: Optional[List[Optional[str]]] = None,
+                              k: int = 4, max_concurrency: int = 4,
+                              use_cache: bool = True) -> List[Any]:
+    """
+    Run answer_async for every question, at most max_concurrency at a time.
+    With the cache on, all questions are embedded in one encoder pass and
+    checked against the semantic cache in one matrix product first; only the
+    misses go on to retrieval + LLM, reusing their embedding.
+
+    Safe to await from a running loop (e.g. next to server requests): it uses
+    the shared AsyncClient but never closes it.
+    """
+    n = len(questions)
+    if drug_names is None:
+        drug_names = [None] * n
+    if len(drug_names) != n:
+        raise ValueError("drug_names must have the same length as questions")
+    sem = asyncio.Semaphore(max(1, int(max_concurrency)))
+    embs: List[Optional[List[float]]] = [None] * n
+    cached: List[Optional[Dict[str, Any]]] = [None] * n
+    if use_cache and n:
+        try:
+            embs = list(await asyncio.to_thread(embed_questions, questions))
+        except Exception:
+            embs = [None] * n            # encoder failed: answer without the cache pre-pass
+        else:
+            spaces = [_cache_scope(d, k)[1] for d in drug_names]
+            cached = _SEM_CACHE.lookup_many(embs, spaces)
+
+    async def _one(i: int) -> Dict[str, Any]:
+        if cached[i] is not None:
+            return cached[i]
+        async with sem:
+            return await answer_async(questions[i], drug_name=drug_names[i], k=k,
+                                      use_cache=use_cache, query_embedding=embs[i])
+
+    return await asyncio.gather(*(_one(i) for i in range(n)), return_exceptions=True)
+
+def answer_batch(questions: List[str],
+                 drug_names: Optional[List[Optional[str]]] = None,
+                 k: int = 4, max_concurrency: int = 4,
+                 use_cache: bool = True) -> List[Any]:
+    """
+    Answer many questions concurrently (e.g. evaluating a test set).
+
+    Args:
+      questions: list of clinical questions
+      drug_names: optional list of drug names, same length as questions
+                  (None entries = no drug for that question)
+      k: number of top guideline snippets per question
+      max_concurrency: questions in flight at once; match it to the server's
+                       OLLAMA_NUM_PARALLEL, more only makes requests queue there
+      use_cache: look up / store answers in the semantic cache
+
+    Returns:
+      A list in the same order as `questions`. Each item is either the answer
+      dict (same shape as answer()) or the Exception that question raised —
+      one failed question does not sink the whole batch.
+
+    Note: this starts its own event loop (asyncio.run); inside async code,
+    await _answer_batch_async(...) or gather answer_async(...) directly.
+    """
+    async def _run() -> List[Any]:
+        try:
+            return await _answer_batch_async(questions, drug_names, k=k,
+                                             max_concurrency=max_concurrency,
+                                             use_cache=use_cache)
+        finally:
+            # this event loop ends with asyncio.run: release its client here
+            await aclose_async_client()
+
+    return asyncio.run(_run())
 
 # =============================================================================
 #                                   CLI
@@ -398,13 +1311,24 @@ def _build_cli() -> argparse.ArgumentParser:
     Simple command-line interface so you can test the pipeline without a UI.
     Example:
       python -m rag.pipeline --q "...问题..." --drug "氨氯地平" --k 4 --print-prompt
+      python -m rag.pipeline --q-file questions.jsonl --concurrency 4 --json
+
+    With a running server (see server.py), use the thin client instead; it
+    skips the local model/DB start-up:
+      python -m rag.client --q "...问题..."
+
+    --q-file: one JSON object per line, {"question": "...", "drug": "..."}
+    ("drug" optional; a bare JSON string line is also accepted as a question).
     """
     p = argparse.ArgumentParser(
         prog="CareMind-RAG-Pipeline",
         description="Run Q&A over Chinese medical guidelines + structured drug table via Ollama Qwen2."
     )
-    p.add_argument("--q", "--question", dest="question", required=True,
-                   help="临床问题（中文推荐）")
+    src = p.add_mutually_exclusive_group(required=True)
+    src.add_argument("--q", "--question", dest="question",
+                     help="临床问题（中文推荐）")
+    src.add_argument("--q-file", dest="q_file", default=None,
+                     help="批量问题文件（JSONL，每行 {\"question\": ..., \"drug\": ...}）")
     p.add_argument("--drug", dest="drug", default=None,
                    help="药品名称（可选）")
     p.add_argument("--k", dest="k", type=int, default=4,
@@ -413,21 +1337,90 @@ def _build_cli() -> argparse.ArgumentParser:
                    help="调试：打印拼接后的 user prompt")
     p.add_argument("--json", action="store_true",
                    help="以 JSON 格式输出完整结果")
+    p.add_argument("--no-cache", action="store_true",
+                   help="不使用语义缓存（每次都检索并调用 LLM）")
+    p.add_argument("--concurrency", type=int,
+                   default=int(os.getenv("OLLAMA_NUM_PARALLEL", "4")),
+                   help="批量模式并发数（默认取 OLLAMA_NUM_PARALLEL，否则 4）")
+    p.add_argument("-v", "--verbose", action="store_true",
+                   help="输出 INFO 日志（含预热结果与 Ollama 实际使用的 Content-Encoding）")
     return p
 
+def _json_text(obj: Any, indent: bool = False) -> str:
+    """orjson -> str for CLI output (UTF-8, Chinese kept as-is; numpy scores allowed)."""
+    opts = orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY
+    if indent:
+        opts |= orjson.OPT_INDENT_2
+    return orjson.dumps(obj, option=opts).decode("utf-8")
+
+def _read_q_file(path: str, default_drug: Optional[str]) -> Tuple[List[str], List[Optional[str]]]:
+    """Parse a --q-file JSONL into parallel lists of questions and drug names."""
+    questions: List[str] = []
+    drugs: List[Optional[str]] = []
+    with open(path, "r", encoding="utf-8") as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            row = orjson.loads(line)
+            if isinstance(row, str):
+                row = {"question": row}
+            q = row.get("question") or row.get("q")
+            if not q:
+                continue
+            questions.append(str(q))
+            drugs.append(row.get("drug") or default_drug)
+    return questions, drugs
+
+def _main_batch(args: argparse.Namespace) -> None:
+    """--q-file mode: answer every line concurrently, print results in file order."""
+    questions, drugs = _read_q_file(args.q_file, args.drug)
+    results = answer_batch(questions, drugs, k=args.k,
+                           max_concurrency=args.concurrency,
+                           use_cache=not args.no_cache)
+
+    for q, d, res in zip(questions, drugs, results):
+        if isinstance(res, BaseException):
+            if args.json:
+                print(_json_text({"question": q, "drug_name": d, "error": str(res)}))
+            else:
+                print(f"====== Q: {q} ======\n[ERROR] {res}\n")
+            continue
+        if args.json:
+            print(_json_text({"question": q, "drug_name": d, **res}))
+        else:
+            print(f"====== Q: {q} ======\n{res['output']}\n")
+
 def main() -> None:
     """
     Entry point for `python -m rag.pipeline`.
     Prints either:
-      - the model's plain answer, or
+      - the model's plain answer, streamed token by token as it is generated, or
       - (with --print-prompt) the system prompt, user prompt, and the answer,
       - (with --json) a JSON blob with everything (handy for logging).
+    With --q-file, every question is answered concurrently (one block, or one
+    JSON line with --json, per question).
     """
     args = _build_cli().parse_args()
-    res = answer(args.question, drug_name=args.drug, k=args.k)
+    if args.verbose:
+        logging.basicConfig(level=logging.INFO, format="%(levelname)s %(name)s: %(message)s")
+        if _WARMUP_THREAD is not None and not _WARMUP_THREAD.is_alive():
+            _log_content_encoding()  # warm-up finished before logging was configured
+    if args.q_file:
+        _main_batch(args)
+        return
+
+    if not args.json and not args.print_prompt:
+        # Interactive default: print tokens as they arrive
+        answer(args.question, drug_name=args.drug, k=args.k, use_cache=not args.no_cache,
+               on_token=lambda tok: print(tok, end="", flush=True))
+        print()
+        return
+
+    res = answer(args.question, drug_name=args.drug, k=args.k, use_cache=not args.no_cache)
 
     if args.json:
-        print(json.dumps(res, ensure_ascii=False, indent=2))
+        print(_json_text(res, indent=True))
         return
 
     if args.print_prompt:
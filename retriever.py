@@ -79,6 +79,12 @@ def embed_text(text: str) -> List[float]:
     return model.encode([text], normalize_embeddings=True).tolist()[0]
 
 
+def embed_texts(texts: List[str], batch_size: int = 32) -> List[List[float]]:
+    # 批量编码：一次前向处理多条文本（批量问答时比逐条 embed_text 快得多）
+    model = get_embedder()
+    return model.encode(list(texts), batch_size=batch_size, normalize_embeddings=True).tolist()
+
+
 # =========================
 # Chroma helpers
 # =========================
@@ -188,10 +194,15 @@ def get_chroma_collection():
     语义检索（cosine 距离→相似度 1 - distance）
     返回：[{id, content, meta, score, source}]
 """
-def search_guidelines(query: str, k: int = 6, where: Optional[Dict[str, Any]] = None):
+def search_guidelines(query: str, k: int = 6, where: Optional[Dict[str, Any]] = None,
+                      query_embedding: Optional[List[float]] = None):
     col = get_chroma_collection()
-    enc = get_embedder()  # loads BAAI/bge-large-zh-v1.5 on cuda/cpu
-    qvec = enc.encode([query], normalize_embeddings=True).tolist()
+    if query_embedding is not None:
+        # 调用方已向量化（如语义缓存查询时），避免重复编码
+        qvec = [list(query_embedding)]
+    else:
+        enc = get_embedder()  # loads BAAI/bge-large-zh-v1.5 on cuda/cpu
+        qvec = enc.encode([query], normalize_embeddings=True).tolist()
 
     # kwargs = dict(query_texts=[query], n_results=k,
     #               include=["documents", "metadatas", "distances"])
@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+"""
+CareMind RAG — HTTP Server (FastAPI)
+
+Why a server? Every `python -m rag.pipeline --q ...` run pays interpreter
+start-up, imports, loading the embedding model and the first (cold) Ollama
+call before it can answer. A long-lived process pays those once: the HTTP
+session, the warm model, the embedding model and the semantic cache all stay
+alive between questions.
+
+--------------------------------------------------------------------------------
+Quick Start (from project root):
+    pip install fastapi uvicorn
+    uvicorn rag.server:app --host 0.0.0.0 --port 8000
+
+    # ask from the CLI (thin client, no local model loading) ...
+    python -m rag.client --q "老年高血压的降压目标？" --drug "氨氯地平"
+
+    # ... or from anything that speaks HTTP
+    curl -X POST http://localhost:8000/answer -H "Content-Type: application/json" \
+         -d '{"question": "老年高血压的降压目标？", "drug": "氨氯地平", "k": 4}'
+
+Endpoints:
+    POST /answer   {"question": str, "drug": str|null, "k": int, "use_cache": bool}
+                   -> same dict as pipeline.answer() (output, guideline_hits, drug, prompt)
+    GET  /health   -> {"status": "ok", "model": ..., "cache_entries": ...,
+                       "content_encoding": ...}  (Ollama's reply encoding, null until warmed up)
+--------------------------------------------------------------------------------
+"""
+
+from __future__ import annotations
+import asyncio
+from contextlib import asynccontextmanager
+from typing import Optional
+
+import orjson
+from fastapi import FastAPI, HTTPException, Response
+from pydantic import BaseModel, Field
+
+from . import pipeline as P
+
+
+class AnswerRequest(BaseModel):
+    """Body of POST /answer (mirrors the arguments of pipeline.answer)."""
+    question: str = Field(..., min_length=1, description="临床问题（中文推荐）")
+    drug: Optional[str] = Field(None, description="药品名称（可选）")
+    k: int = Field(4, ge=1, le=50, description="检索到的指南片段数量（Top-k）")
+    use_cache: bool = Field(True, description="是否使用语义缓存")
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Start-up / shut-down hooks:
+      1) warm up Ollama in the background (model load takes seconds; don't block start-up)
+      2) open the shared async HTTP client on the server's event loop
+      3) load the embedding model once and size the semantic-cache matrix
+    """
+    P.start_warmup()
+    P._aclient()
+    try:
+        emb = await asyncio.to_thread(P.embed_question, "预热")
+        P._SEM_CACHE.reserve(len(emb))
+    except Exception:
+        # Embedding problems surface on the first real question instead
+        pass
+    yield
+    await P.aclose_async_client()
+
+
+app = FastAPI(title="CareMind RAG", lifespan=lifespan)
+
+
+@app.post("/answer")
+async def answer_endpoint(req: AnswerRequest):
+    try:
+        res = await P.answer_async(req.question, drug_name=req.drug, k=req.k,
+                                   use_cache=req.use_cache)
+    except RuntimeError as e:
+        # LLM unreachable / failed after retries
+        raise HTTPException(status_code=502, detail=str(e))
+    # Encode with orjson ourselves: fast on long Chinese text, and it copes
+    # with numpy scores inside guideline_hits
+    body = orjson.dumps(res, option=orjson.OPT_NON_STR_KEYS | orjson.OPT_SERIALIZE_NUMPY)
+    return Response(content=body, media_type="application/json")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "model": P.MODEL, "cache_entries": len(P._SEM_CACHE),
+            "content_encoding": P._CONTENT_ENCODING}